@@ -0,0 +1,363 @@
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+from model import Model
+from results_store import ResultsStore
+from worker import SimulationWorker
+
+
+class Charts(tk.Toplevel):
+    # persistent chart window: the lines are updated in place from the series and redrawn by blitting them over a
+    # cached background, the whole figure is drawn again only when the axes limits have to grow
+    ylabels = {'incomes': 'прибыль', 'expenses': 'убыль', 'couriers_overloading': 'количество курьеров'}
+    
+    def __init__(self, root, series):
+        # matplotlib is only loaded once charts are opened
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        
+        super().__init__(root)
+        self.title(u'Графики моделирования')
+        self.geometry('700x760+300+20')
+        self.resizable(True, True)
+        self.series = series
+        
+        self.figure = Figure(figsize=(7, 7.2), dpi=100)
+        axes = self.figure.subplots(len(self.ylabels), 1, sharex=True)
+        self.lines = {}
+        for ax, (name, ylabel) in zip(axes, self.ylabels.items()):
+            ax.set_ylabel(ylabel)
+            self.lines[name], = ax.plot([], [], animated=True)
+        axes[-1].set_xlabel('день')
+        self.n_drawn = 0
+        self.reset_limits()
+        
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.button_exit = tk.Button(self, text='Exit', width=50, command=self.exit, fg='darkred')
+        self.button_exit.pack()
+        self.refresh()
+    
+    def reset_limits(self):
+        for line in self.lines.values():
+            line.axes.set_xlim(1, 10)
+            line.axes.set_ylim(0, 1)
+    
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_lines()
+    
+    def draw_lines(self):
+        for line in self.lines.values():
+            line.axes.draw_artist(line)
+    
+    def refresh(self):
+        redraw = self.background is None
+        n_days = min([len(days) for days, _ in self.series.values()])
+        if n_days < self.n_drawn:
+            # a new run has started
+            self.reset_limits()
+            self.n_drawn = 0
+            redraw = True
+        for name, line in self.lines.items():
+            days, values = self.series[name]
+            line.set_data(days, values)
+            if not days:
+                continue
+            ax = line.axes
+            # limits grow geometrically, so a long run redraws the whole figure only a logarithmic number of times
+            if days[-1] > ax.get_xlim()[1]:
+                ax.set_xlim(1, 2 * days[-1])
+                redraw = True
+            top = max(values[self.n_drawn:], default=0)
+            if top > ax.get_ylim()[1]:
+                ax.set_ylim(0, 1.5 * top)
+                redraw = True
+        self.n_drawn = n_days
+        if redraw:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_lines()
+            self.canvas.blit(self.figure.bbox)
+    
+    def exit(self):
+        self.destroy()
+
+
+class Application(tk.Frame):
+    def __init__(self, root, model):
+        super().__init__(root)
+        self.root = root
+        self.bg = 'lightgreen'
+        self.text_bg = 'lightblue'
+        self.root.configure(bg=self.bg)
+        self.model = model
+        # the model runs in a SimulationWorker, the GUI polls its messages every poll_ms and keeps the metrics of the
+        # finished days as (days, values) lists in self.series, which the charts window plots while a run goes on
+        self.worker = None
+        self.lock = threading.Lock()
+        self.poll_ms = 50
+        self.series = self.new_series()
+        self.charts = None
+        
+        self.build_gui()
+    
+    def params_widgets(self):
+        l_bg = 'lightgrey'
+        self.params_frame = tk.Frame(self.upper_root, borderwidth=1, relief=tk.SUNKEN, bg='lightgrey')
+        self.params_frame.pack(side=tk.RIGHT)
+        self.params_total_days = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
+                                          from_=20, to=180, tickinterval=30, resolution=10, bd=2)
+        self.params_extra_cost = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
+                                          from_=0.01, to=1.0, tickinterval=0.2, resolution=0.01, bd=2)
+        self.params_discount = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
+                                        from_=0.01, to=0.07, tickinterval=0.03, resolution=0.01, bd=2)
+        self.params_medicines_cnt = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
+                                             from_=10, to=100, tickinterval=15, resolution=1, bd=2)
+        self.params_couriers_cnt = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
+                                            from_=5, to=20, tickinterval=5, resolution=1, bd=2)
+        self.params_cap_couriers_v = tk.BooleanVar(value=self.model.cap_couriers)
+        self.params_cap_couriers = tk.Checkbutton(self.params_frame, variable=self.params_cap_couriers_v,
+                                                  bg=l_bg)
+        self.params_total_days_l = tk.Label(self.params_frame, text='колич. дней:', font='Arial 18', bg=l_bg,
+                                            fg='black')
+        self.params_extra_cost_l = tk.Label(self.params_frame, text=u'наценка:', font='Arial 18', bg=l_bg,
+                                            fg='black')
+        self.params_discount_l = tk.Label(self.params_frame, text=u'скидка:', font='Arial 18', bg=l_bg,
+                                          fg='black')
+        self.params_medicines_cnt_l = tk.Label(self.params_frame, text=u'колич. лекарств:', font='Arial 18',
+                                               bg=l_bg, fg='black')
+        self.params_couriers_cnt_l = tk.Label(self.params_frame, text=u'макс. колич. курьеров:', font='Arial 18',
+                                              bg=l_bg, fg='black')
+        self.params_cap_couriers_l = tk.Label(self.params_frame, text=u'ограничить курьеров:', font='Arial 18',
+                                              bg=l_bg, fg='black')
+        padx = 0
+        self.params_total_days.grid(row=0, column=1, padx=padx)
+        self.params_total_days_l.grid(row=0, column=0, padx=padx)
+        self.params_extra_cost.grid(row=1, column=1, padx=padx)
+        self.params_extra_cost_l.grid(row=1, column=0, padx=padx)
+        self.params_discount.grid(row=2, column=1, padx=padx)
+        self.params_discount_l.grid(row=2, column=0, padx=padx)
+        self.params_medicines_cnt.grid(row=3, column=1, padx=padx)
+        self.params_medicines_cnt_l.grid(row=3, column=0, padx=padx)
+        self.params_couriers_cnt.grid(row=4, column=1, padx=padx)
+        self.params_couriers_cnt_l.grid(row=4, column=0, padx=padx)
+        self.params_cap_couriers.grid(row=5, column=1, padx=padx)
+        self.params_cap_couriers_l.grid(row=5, column=0, padx=padx)
+    
+    def com_widgets(self):
+        fg = 'blue'
+        button_w = 25
+        
+        self.com_frame = tk.Frame(self.upper_root, height=240, borderwidth=1, relief=tk.FLAT, bg='lightgrey')
+        self.com_frame.pack(side=tk.LEFT, padx=15)
+        self.button_launch = tk.Button(self.com_frame, width=button_w, text='Запустить', fg=fg, command=self.run)
+        # self.button_launch.grid(row=0, column=1, pady=10)
+        self.button_next_day = tk.Button(self.com_frame, text='Следующий день', fg=fg, command=self.run_day,
+                                         width=button_w)
+        # self.button_next_day.grid(row=1, column=1, pady=10)
+        self.button_cancel = tk.Button(self.com_frame, text='Остановить', fg=fg, command=self.cancel, width=button_w,
+                                       state=tk.DISABLED)
+        self.progress = ttk.Progressbar(self.com_frame, orient=tk.HORIZONTAL, length=200, mode='determinate')
+        self.progress_l = tk.Label(self.com_frame, text='', bg='lightgrey', fg='black')
+        self.button_show_overloading = tk.Button(self.com_frame, text='Показать перегрузку', fg=fg,
+                                                 command=self.show_overloading, width=button_w)
+        self.button_show_logs = tk.Button(self.com_frame, text='Показать логи', fg=fg, command=self.show_logs,
+                                          width=button_w)
+        # self.button_show_logs.grid(row=2, column=1, pady=10)
+        self.button_show_incomes = tk.Button(self.com_frame, text='Показать прибыль', fg=fg,
+                                             command=self.show_incomes, width=button_w)
+        # self.button_show_incomes.grid(row=3, column=1, pady=10)
+        self.button_show_expenses = tk.Button(self.com_frame, text='Показать убыль', fg=fg,
+                                              command=self.show_expenses, width=button_w)
+        # self.button_show_expenses.grid(row=4, column=1, pady=10)
+        self.button_show_available = tk.Button(self.com_frame, text='Показать доступные лекарства', fg=fg,
+                                               command=self.show_available_meds, width=button_w)
+        self.button_show_kpi = tk.Button(self.com_frame, text='Показать показатели', fg=fg, command=self.show_kpi,
+                                         width=button_w)
+        self.button_clear = tk.Button(self.com_frame, text='Очистить', fg=fg, command=self.clear_output, width=button_w)
+        self.button_exit = tk.Button(self.com_frame, text='Выйти', fg=fg, command=self.exit, width=button_w)
+        padx, pady = 0, 5
+        self.button_launch.pack(padx=padx, pady=pady)
+        self.button_next_day.pack(padx=padx, pady=pady)
+        self.button_cancel.pack(padx=padx, pady=pady)
+        self.progress.pack(padx=padx, pady=pady)
+        self.progress_l.pack(padx=padx, pady=pady)
+        self.button_show_overloading.pack(padx=padx, pady=pady)
+        self.button_show_logs.pack(padx=padx, pady=pady)
+        self.button_show_incomes.pack(padx=padx, pady=pady)
+        self.button_show_expenses.pack(padx=padx, pady=pady)
+        self.button_show_available.pack(padx=padx, pady=pady)
+        self.button_show_kpi.pack(padx=padx, pady=pady)
+        self.button_clear.pack(padx=padx, pady=pady)
+        self.button_exit.pack(padx=padx, pady=pady)
+    
+    def build_gui(self):
+        self.model.init()
+        self.upper_root = tk.Frame(self.root, bg=self.bg)
+        self.upper_root.grid(row=0)
+        self.lower_root = tk.Frame(self.root)
+        self.lower_root.grid(row=1)
+        self.params_widgets()
+        self.com_widgets()
+        self.text = tk.Text(self.lower_root, bd=1, relief=tk.RAISED, font=('times', 14), wrap=tk.WORD, bg=self.text_bg,
+                            width=77)
+        self.text.pack(padx=0)
+    
+    def clear_output(self):
+        self.text.delete('1.0', tk.END)
+    
+    def update_model(self):
+        medicines_cnt = int(self.params_medicines_cnt.get())
+        extra_cost = float(self.params_extra_cost.get())
+        total_days = int(self.params_total_days.get())
+        discount = float(self.params_discount.get())
+        max_couriers_cnt = int(self.params_couriers_cnt.get())
+        cap_couriers = bool(self.params_cap_couriers_v.get())
+        self.model.medicines_cnt = medicines_cnt
+        self.model.extra_cost = extra_cost
+        self.model.total_days = total_days
+        self.model.discount = discount
+        self.model.max_couriers_cnt = max_couriers_cnt
+        self.model.cap_couriers = cap_couriers
+        if self.model.delivery_service is not None:
+            # a running simulation takes the courier limit from its next day on
+            self.model.delivery_service.max_couriers = max_couriers_cnt
+            self.model.delivery_service.cap_couriers = cap_couriers
+    
+    def new_series(self):
+        return dict([(x, ([], [])) for x in ResultsStore.metrics])
+    
+    def is_running(self):
+        return self.worker is not None and self.worker.is_alive()
+    
+    def run(self):
+        if self.is_running():
+            return
+        self.clear_output()
+        self.update_model()
+        self.model.init()
+        for days, values in self.series.values():
+            days.clear()
+            values.clear()
+        self.text.insert(1.0, f'Происходит моделирование на длительность {self.model.total_days} дней ...\n')
+        self.start_worker(self.model.total_days)
+    
+    def run_day(self):
+        if self.is_running():
+            return
+        self.update_model()
+        self.text.insert(tk.END, f'Моделирование за {self.model.curr_day}-й день ...\n')
+        self.start_worker(1)
+    
+    def start_worker(self, n_days):
+        self.worker = SimulationWorker(self.model, n_days, lock=self.lock).start()
+        self.progress.configure(maximum=n_days, value=0)
+        self.progress_l.configure(text=f'0 / {n_days}')
+        self.button_launch.configure(state=tk.DISABLED)
+        self.button_next_day.configure(state=tk.DISABLED)
+        self.button_cancel.configure(state=tk.NORMAL)
+        self.after(self.poll_ms, self.poll_worker)
+    
+    def poll_worker(self):
+        for message in self.worker.poll():
+            if message[0] == 'day':
+                _, day, metrics = message
+                for name, value in metrics.items():
+                    days, values = self.series[name]
+                    days.append(day)
+                    values.append(value if value is not None else 0.0)
+                self.progress.step(1)
+                self.progress_l.configure(text=f'{int(self.progress["value"])} / {self.worker.n_days}')
+            elif message[0] == 'done':
+                self.text.insert(tk.END, 'Моделирование завершилось!\n')
+            elif message[0] == 'cancelled':
+                self.text.insert(tk.END, f'Моделирование остановлено перед {message[1]}-м днём.\n')
+            else:
+                self.text.insert(tk.END, f'Ошибка моделирования: {message[1]}\n')
+        if self.charts is not None and self.charts.winfo_exists():
+            self.charts.refresh()
+        if self.is_running() or not self.worker.messages.empty():
+            self.after(self.poll_ms, self.poll_worker)
+        else:
+            self.button_launch.configure(state=tk.NORMAL)
+            self.button_next_day.configure(state=tk.NORMAL)
+            self.button_cancel.configure(state=tk.DISABLED)
+    
+    def cancel(self):
+        if self.is_running():
+            self.worker.cancel()
+    
+    def show_charts(self):
+        if self.charts is None or not self.charts.winfo_exists():
+            self.charts = Charts(self.root, self.series)
+        self.charts.lift()
+        self.charts.focus_set()
+    
+    def show_overloading(self):
+        self.show_charts()
+    
+    def show_available_meds(self):
+        with self.lock:
+            quantities = dict(self.model.medicine_ware_house.get_quantities())
+        text = '\n'.join([':'.join([x, str(c)]) for x, c in quantities.items() if c > 0]) + '\n'
+        self.clear_output()
+        self.text.insert(1.0, text)
+    
+    def show_kpi(self):
+        with self.lock:
+            summary = self.model.kpi.summary()
+        names = {'daily': 'за день', 'rolling_7': 'за 7 дней', 'rolling_30': 'за 30 дней', 'cumulative': 'всего'}
+        self.clear_output()
+        self.text.insert(tk.END, f"ПОКАЗАТЕЛИ [день: {summary['day']}]\n")
+        for key, name in names.items():
+            kpis = summary[key]
+            self.text.insert(tk.END, f"{name}: выручка {kpis['revenue']:.2f}, затраты {kpis['cost']:.2f}, "
+                                     f"маржа {kpis['margin']:.2f}, списано {kpis['write_offs']:.2f}, "
+                                     f"дефицит {kpis['stockout_rate']:.1%}\n")
+    
+    def show_logs(self):
+        with self.lock:
+            self.insert_logs()
+    
+    def insert_logs(self):
+        self.clear_output()
+        for i in range(max(self.model.curr_day - 20, 1), self.model.curr_day):
+            orders_text = '\n'.join([': '.join([k, '\n\t' + '\n\t'.join([f'{x}:{y}' for x, y in v])]) for k, v in
+                                     self.model.db[i]['orders'].items()])
+            orders_text = f'\nORDERS [day: {i + 1}]\n{orders_text}\n'
+            resolved_orders_text = '\n'.join(
+                [': '.join([k, '\n\t' + '\n\t'.join([f'{x}:{y}' for x, y in v])]) for k, v in
+                 self.model.db[i]['resolved_orders'].items()])
+            resolved_orders_text = f'\nRESOLVED ORDERS [day: {i + 1}]\n{resolved_orders_text}\n'
+            self.text.insert(tk.END, orders_text)
+            self.text.insert(tk.END, resolved_orders_text)
+    
+    def show_incomes(self):
+        self.show_charts()
+    
+    def show_expenses(self):
+        self.show_charts()
+    
+    def exit(self):
+        self.cancel()
+        self.clear_output()
+        self.root.destroy()
+
+
+def main():
+    root, model = tk.Tk(), Model()
+    application = Application(root, model)
+    
+    root.title('Аптека')
+    root.geometry('680x750+300+20')
+    root.resizable(True, False)
+    root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from random import Random
+
+from delivery_service import DeliveryService
+from events import ORDER, RETURN, EventQueue
+from medicine_ware_house import Medicine, MedicineWareHouse, Order, SortedStock
+from model import Model
+from routing import RoutePlanner
+
+SCALES = {
+    'small': dict(skus=10, units=10_000, orders=500, couriers=10, days=10),
+    'medium': dict(skus=1_000, units=100_000, orders=5_000, couriers=100, days=10),
+    'large': dict(skus=10_000, units=1_000_000, orders=50_000, couriers=1_000, days=5),
+}
+FORMS = ["Таблетки", "Суспензия", "Спрей", "Сироп", "Мазь", "Капли"]
+SEED = 2022
+# the simulation core has to import with the standard library only, GUI, plotting and NumPy are loaded on demand
+CORE_MODULES = ('model', 'medicine_ware_house', 'delivery_service', 'routing', 'events', 'results_store', 'order_log')
+ON_DEMAND_MODULES = ('tkinter', 'matplotlib', 'numpy')
+IMPORT_CODE = '''
+import json, sys, time
+start = time.perf_counter()
+for name in sys.argv[1:]:
+    __import__(name)
+print(json.dumps({'time': time.perf_counter() - start, 'modules': sorted(sys.modules)}))
+'''
+
+BENCHMARKS = {}
+
+
+def benchmark(func):
+    # a benchmark does its setup and returns the callable that is timed
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def make_medicines(skus):
+    # about 24 skus share a name, so that partial queries match several of them
+    n_names = max(1, skus // 24)
+    return [Medicine(f'Лекарство{i % n_names}', FORMS[(i // n_names) % len(FORMS)], str(25 + i // (n_names * 6)),
+                     ttl=50 + i % 200) for i in range(skus)]
+
+
+def make_warehouse(params, rng):
+    medicines = make_medicines(params['skus'])
+    warehouse = MedicineWareHouse(medicines, rng=rng)
+    per_lot = max(1, params['units'] // (4 * len(medicines)))
+    for day in range(4):
+        for medicine in medicines:
+            warehouse.add_medicine(medicine.change(ttl=medicine.ttl + day * 10), per_lot)
+        warehouse.goto_next_day()
+    return warehouse, medicines
+
+
+@benchmark
+def add_elements(params, rng):
+    medicines = make_medicines(params['skus'])
+    stock = SortedStock(medicines)
+    units = [medicines[rng.randrange(len(medicines))].change(ttl=rng.randint(50, 250)) for _ in range(1_000)]
+    units = [units[rng.randrange(len(units))] for _ in range(params['units'])]
+    return lambda: stock.add_elements(units)
+
+
+@benchmark
+def extract_element(params, rng):
+    warehouse, medicines = make_warehouse(params, rng)
+    requests = [(medicines[rng.randrange(len(medicines))], rng.randint(1, 5)) for _ in range(params['orders'])]
+    
+    def run():
+        for medicine, quantity in requests:
+            warehouse.stock.extract_element(medicine, quantity)
+    
+    return run
+
+
+@benchmark
+def goto_next_day(params, rng):
+    warehouse, _ = make_warehouse(params, rng)
+    
+    def run():
+        for _ in range(params['days']):
+            warehouse.goto_next_day()
+    
+    return run
+
+
+@benchmark
+def get_medicine(params, rng):
+    warehouse, medicines = make_warehouse(params, rng)
+    queries = []
+    for _ in range(params['orders']):
+        medicine = medicines[rng.randrange(len(medicines))]
+        mask = rng.getrandbits(2)
+        query = Medicine(medicine.name, medicine.form if mask & 1 else None, medicine.dosage if mask & 2 else None)
+        queries.append((query.id(), rng.randint(1, 5), rng.random() < 0.65))
+    
+    def run():
+        for query, quantity, is_sale in queries:
+            warehouse.get_medicine(query, quantity, is_sale=is_sale)
+    
+    return run
+
+
+@benchmark
+def allocate(params, rng):
+    # the queries of get_medicine, allocated as one day
+    warehouse, medicines = make_warehouse(params, rng)
+    lines = []
+    for _ in range(params['orders']):
+        medicine = medicines[rng.randrange(len(medicines))]
+        mask = rng.getrandbits(2)
+        query = Medicine(medicine.name, medicine.form if mask & 1 else None, medicine.dosage if mask & 2 else None)
+        lines.append((query.id(), rng.randint(1, 5), rng.random() < 0.65))
+    return lambda: warehouse.allocate(lines)
+
+
+@benchmark
+def distribute(params, rng):
+    delivery_service = DeliveryService(min_couriers=params['couriers'], max_orders_pc=4)
+    delivery_list = [None] * params['orders']
+    
+    def run():
+        for _ in range(params['days']):
+            delivery_service.distribute(delivery_list)
+            delivery_service.goto_next_day()
+    
+    return run
+
+
+def make_schedule(params, rng, method):
+    # a day of orders to addresses on orders // 50 streets, planned into trips and given to the couriers
+    n_streets = max(1, params['orders'] // 50)
+    delivery_list = [Order('', f'Улица{rng.randrange(n_streets)}, {rng.randint(0, 100)}', [], None, False)
+                     for _ in range(params['orders'])]
+    delivery_service = DeliveryService(min_couriers=params['couriers'], max_orders_pc=15,
+                                       planner=RoutePlanner(capacity=15, method=method))
+    
+    def run():
+        delivery_service.distribute(delivery_list)
+        delivery_service.goto_next_day()
+    
+    return run
+
+
+@benchmark
+def schedule_sweep(params, rng):
+    return make_schedule(params, rng, 'sweep')
+
+
+@benchmark
+def schedule_savings(params, rng):
+    return make_schedule(params, rng, 'savings')
+
+
+@benchmark
+def event_queue(params, rng):
+    # a day's sorted arrivals of `orders` events, each followed by an event pushed an hour later, popped in order
+    arrivals = sorted([rng.uniform(8, 20) for _ in range(params['orders'])])
+    
+    def run():
+        for day in range(params['days']):
+            queue = EventQueue()
+            queue.extend_sorted([(day * 24 + x, ORDER, None) for x in arrivals])
+            while len(queue) > 0:
+                time, _, kind, _ = queue.pop()
+                if kind == ORDER:
+                    queue.push(time + 1, RETURN)
+    
+    return run
+
+
+@benchmark
+def model_run(params, rng):
+    model = Model(medicines_cnt=min(params['skus'], 5_000), total_days=params['days'], rng=rng)
+    model.init()
+    model.orders_min_cnt = model.orders_max_cnt = params['orders']
+    return model.run
+
+
+@benchmark
+def intraday_run(params, rng):
+    # model_run with the days run as events
+    model = Model(medicines_cnt=min(params['skus'], 5_000), total_days=params['days'], rng=rng, intraday=True)
+    model.init()
+    model.orders_min_cnt = model.orders_max_cnt = params['orders']
+    return model.run
+
+
+def measure(name, params, repeat):
+    times = []
+    for _ in range(repeat):
+        run = BENCHMARKS[name](params, Random(SEED))
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    run = BENCHMARKS[name](params, Random(SEED))
+    tracemalloc.start()
+    run()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'time': min(times), 'times': times, 'peak_memory': peak_memory}
+
+
+def measure_imports(modules, repeat):
+    # every import is timed in a fresh interpreter, since a module is only imported once per process
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_CODE, *modules], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        result = json.loads(output)
+        times.append(result['time'])
+    loaded = [x for x in ON_DEMAND_MODULES if x in result['modules']]
+    return {'modules': list(modules), 'time': min(times), 'times': times, 'on_demand_loaded': loaded}
+
+
+def check_imports(imports, budget):
+    imports['budget'] = budget
+    imports['over_budget'] = imports['time'] > budget or len(imports['on_demand_loaded']) > 0
+    return imports
+
+
+def compare(results, baseline, tolerance):
+    # time ratios against the baseline, benchmarks slower than 1 + tolerance are reported as regressions
+    comparison = {}
+    for name, result in results['benchmarks'].items():
+        if name not in baseline['benchmarks']:
+            continue
+        base = baseline['benchmarks'][name]
+        ratio = result['time'] / base['time'] if base['time'] > 0 else float('inf')
+        comparison[name] = {'time_ratio': ratio,
+                            'memory_ratio': result['peak_memory'] / max(base['peak_memory'], 1),
+                            'regression': ratio > 1 + tolerance}
+    return comparison
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark warehouse, delivery and model hot paths.')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    for key in SCALES['small']:
+        parser.add_argument(f'--{key}', type=int, default=None, help=f'override {key} of the scale')
+    parser.add_argument('--only', default=None, help='comma separated benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None, help='JSON file for the results, stdout by default')
+    parser.add_argument('--baseline', default=None, help='JSON results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--import-budget', type=float, default=0.2,
+                        help='seconds the simulation core may take to import in a fresh interpreter')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = dict(SCALES[args.scale])
+    for key in params:
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    results = {'scale': args.scale, 'params': params, 'python': platform.python_version(), 'benchmarks': {}}
+    for name in names:
+        results['benchmarks'][name] = measure(name, params, args.repeat)
+        print(f"{name}: {results['benchmarks'][name]['time']:.4f}s, "
+              f"peak {results['benchmarks'][name]['peak_memory'] / 2 ** 20:.1f}MiB", file=sys.stderr)
+    results['imports'] = check_imports(measure_imports(CORE_MODULES, args.repeat), args.import_budget)
+    print(f"core imports: {results['imports']['time']:.4f}s, budget {args.import_budget}s, "
+          f"on demand modules loaded: {results['imports']['on_demand_loaded']}", file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            results['comparison'] = compare(results, json.load(f), args.tolerance)
+    text = json.dumps(results, indent=1)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if any(x['regression'] for x in results.get('comparison', {}).values()) or results['imports']['over_budget']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
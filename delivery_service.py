@@ -1,50 +1,157 @@
+import heapq
+
+
 class DeliveryService:
-    def __init__(self, min_couriers=3, max_couriers=9, min_orders_pc=7, max_orders_pc=15):
+    # without a planner couriers only count orders, up to max_orders_pc each. With a routing.RoutePlanner the day's
+    # orders are planned into trips by their addresses and every trip goes to the courier with the least work so far,
+    # the longest trips first; a trip takes its length at speed_kmh plus stop_minutes per stop. A courier is hired when
+    # a trip would take the least loaded courier over shift_hours, unless cap_couriers stops at max_couriers and the
+    # trip is done in overtime. The overloading is then the day's work in shifts rather than the number of couriers.
+    settings = ('min_couriers', 'max_couriers', 'min_orders_pc', 'max_orders_pc', 'cap_couriers', 'shift_hours',
+                'speed_kmh', 'stop_minutes')
+    
+    def __init__(self, min_couriers=3, max_couriers=9, min_orders_pc=7, max_orders_pc=15, cap_couriers=False,
+                 planner=None, shift_hours=8.0, speed_kmh=20.0, stop_minutes=5.0):
         self.min_couriers = min_couriers
         self.max_couriers = max_couriers
         self.min_orders_pc = min_orders_pc
         self.max_orders_pc = max_orders_pc
+        self.cap_couriers = cap_couriers
+        self.planner = planner
+        self.shift_hours = shift_hours
+        self.speed_kmh = speed_kmh
+        self.stop_minutes = stop_minutes
         self.couriers_list = []
+        # min-heap of (n_orders_done, courier idx) over the couriers that can still take orders; with a planner of
+        # (hours, courier idx) over all couriers
+        self.loads = []
         self.n_hired_couriers = 0
-        for _ in range(self.min_couriers):
-            self.hire()
+        self.n_undelivered_orders = 0
+        self.hire(self.min_couriers)
     
     def get_overloading(self):
+        if self.planner is not None:
+            return sum([x.hours for x in self.couriers_list]) / self.shift_hours
         return self.n_hired_couriers
     
+    def get_driven_overloading(self):
+        # the overloading of the couriers that took orders: their number, with a planner their work in shifts
+        if self.planner is not None:
+            return self.get_overloading()
+        return len([x for x in self.couriers_list if x.n_orders_done > 0])
+    
+    def route_lengths(self):
+        # km driven by every courier on the day
+        return [x.distance for x in self.couriers_list]
+    
     def goto_next_day(self):
-        self.couriers_list = [x.reset() for x in self.couriers_list][:self.min_couriers]
-        self.n_hired_couriers = self.min_couriers
+        self.couriers_list = [x.reset() for x in self.couriers_list[:self.min_couriers]]
+        self.loads = [(0, i) for i in range(len(self.couriers_list))]
+        self.n_hired_couriers = len(self.couriers_list)
+        self.n_undelivered_orders = 0
+    
+    def snapshot(self):
+        snapshot = dict([(x, getattr(self, x)) for x in self.settings])
+        snapshot.update({'n_undelivered_orders': self.n_undelivered_orders,
+                         'n_orders_done': [x.n_orders_done for x in self.couriers_list]})
+        return snapshot
     
-    def hire(self):
-        self.couriers_list.append(Courier(self.max_orders_pc))
+    @classmethod
+    def from_snapshot(cls, snapshot, **params):
+        # params override the snapshot's settings and give the planner, the couriers keep their loads
+        settings = dict([(x, snapshot[x]) for x in cls.settings if x in snapshot])
+        settings.update(params)
+        delivery_service = cls(**dict(settings, min_couriers=0))
+        delivery_service.min_couriers = settings['min_couriers']
+        for n_orders_done in snapshot['n_orders_done']:
+            delivery_service.add_courier(n_orders_done)
+        delivery_service.n_undelivered_orders = snapshot['n_undelivered_orders']
+        return delivery_service
+    
+    def add_courier(self, n_orders_done=0):
+        courier = Courier(self.max_orders_pc)
+        courier.n_orders_done = n_orders_done
+        self.couriers_list.append(courier)
         self.n_hired_couriers += 1
+        if not courier.is_busy():
+            heapq.heappush(self.loads, (n_orders_done, len(self.couriers_list) - 1))
+    
+    def hire(self, n_couriers=1):
+        for _ in range(n_couriers):
+            self.add_courier()
+    
+    def hire_for(self, n_orders):
+        # all couriers are busy: hire as many as the orders need at once, each new courier is loaded to the full
+        n_couriers = -(-n_orders // self.max_orders_pc)
+        if self.cap_couriers:
+            n_couriers = min(n_couriers, max(self.max_couriers - self.n_hired_couriers, 0))
+        for _ in range(n_couriers):
+            n_orders_done = min(self.max_orders_pc, n_orders)
+            self.add_courier(n_orders_done)
+            n_orders -= n_orders_done
+        self.n_undelivered_orders += n_orders
     
     def get_courier_idx(self):
-        couriers_list = sorted([(x, i) for i, x in enumerate(self.couriers_list)], key=lambda x: x[0].n_orders_done)
-        return couriers_list[0][1]
+        if self.loads:
+            return self.loads[0][1]
+        return min(range(len(self.couriers_list)), key=lambda i: self.couriers_list[i].n_orders_done)
     
     def distribute(self, delivery_list):
-        for _ in delivery_list:
-            idx = self.get_courier_idx()
-            if self.couriers_list[idx].is_busy():
-                # if self.n_hired_couriers < self.max_couriers:
-                    self.hire()
-                    self.couriers_list[-1].n_orders_done += 1
-                # else:
-                #     print('too many orders for couriers')
-            else:
-                self.couriers_list[idx].n_orders_done += 1
+        if self.planner is not None:
+            return self.schedule(delivery_list)
+        n_orders = len(delivery_list)
+        while n_orders > 0 and self.loads:
+            n_orders_done, idx = heapq.heappop(self.loads)
+            courier = self.couriers_list[idx]
+            courier.n_orders_done += 1
+            n_orders -= 1
+            if not courier.is_busy():
+                heapq.heappush(self.loads, (courier.n_orders_done, idx))
+        if n_orders > 0:
+            self.hire_for(n_orders)
+    
+    def trip_hours(self, route):
+        return route.length / self.speed_kmh + len(route.stops) * self.stop_minutes / 60
+    
+    def schedule(self, delivery_list):
+        # an OrderBatch gives its addresses without building its orders
+        addresses = getattr(delivery_list, 'addresses', None)
+        addresses = addresses() if addresses is not None else [order.address for order in delivery_list]
+        routes = self.planner.plan(addresses)
+        for route in sorted(routes, key=lambda x: x.length, reverse=True):
+            hours = self.trip_hours(route)
+            can_hire = not self.cap_couriers or self.n_hired_couriers < self.max_couriers
+            if (not self.loads or self.loads[0][0] + hours > self.shift_hours) and can_hire:
+                self.add_courier()
+            if not self.loads:
+                self.n_undelivered_orders += route.n_orders
+                continue
+            workload, idx = self.loads[0]
+            self.couriers_list[idx].assign(route, hours)
+            heapq.heapreplace(self.loads, (workload + hours, idx))
 
 
 class Courier:
     def __init__(self, max_orders=15):
         self.n_orders_done = 0
         self.max_orders = max_orders
+        # the trips of the day with a route planner, their total length and duration
+        self.routes = []
+        self.distance = 0.0
+        self.hours = 0.0
     
     def is_busy(self):
-        return self.n_orders_done == self.max_orders
+        return self.n_orders_done >= self.max_orders
+    
+    def assign(self, route, hours):
+        self.routes.append(route)
+        self.n_orders_done += route.n_orders
+        self.distance += route.length
+        self.hours += hours
     
     def reset(self):
         self.n_orders_done = 0
+        self.routes = []
+        self.distance = 0.0
+        self.hours = 0.0
         return self
@@ -0,0 +1,174 @@
+import heapq
+from collections import deque
+
+# event kinds, in the order the handlers of IntradayEngine are listed
+RESTOCK, OPEN, ORDER, DISPATCH, RETURN, EXPIRY = range(6)
+
+
+class EventQueue:
+    # events (time, seq, kind, data) in time order, ties in the order they were scheduled. A day's order arrivals come
+    # sorted in one go: they are kept in a list next to the heap and merged lazily on pop, so the bulk of the events
+    # costs no heap operations.
+    def __init__(self):
+        self.heap = []
+        self.batch = []
+        self.batch_pos = 0
+        self.seq = 0
+    
+    def __len__(self):
+        return len(self.heap) + len(self.batch) - self.batch_pos
+    
+    def push(self, time, kind, data=None):
+        heapq.heappush(self.heap, (time, self.seq, kind, data))
+        self.seq += 1
+    
+    def extend_sorted(self, events):
+        # events: (time, kind, data) in time order
+        seq = self.seq
+        events = [(time, seq + i, kind, data) for i, (time, kind, data) in enumerate(events)]
+        self.seq += len(events)
+        if self.batch_pos < len(self.batch):
+            events = list(heapq.merge(self.batch[self.batch_pos:], events))
+        self.batch = events
+        self.batch_pos = 0
+    
+    def pop(self):
+        heap, pos = self.heap, self.batch_pos
+        if pos < len(self.batch) and (not heap or self.batch[pos] < heap[0]):
+            self.batch_pos += 1
+            return self.batch[pos]
+        return heapq.heappop(heap)
+
+
+class IntradayEngine:
+    # runs a day of a Model as events on an hour clock, hour 0 of day d being d * 24. Restocks due on the day arrive
+    # at restock_hour; at open_hour the day's orders are generated and arrive spread at random until close_hour. An
+    # order is allocated when it arrives and waits for a courier of the model's DeliveryService: idle couriers are
+    # dispatched at once with up to max_orders_pc waiting orders and return when the trip is done, after the planned
+    # routes of the delivery service's planner or trip_hours without one. Once the waiting orders left fill a whole
+    # trip, couriers are hired for them, within max_couriers if the service caps them. At the end of the day (EXPIRY)
+    # the day is priced, the overloading of the couriers that drove is recorded, the couriers hired for the day are
+    # let go, lots expire and the restocks are requested as in Model.run_day. Trips may run into the next day, orders
+    # wait for them. The orders' waits until dispatch are summed in wait_hours and, for the day, in the model's
+    # counters.
+    def __init__(self, rng, restock_hour=7.0, open_hour=8.0, close_hour=20.0, trip_hours=1.0):
+        self.rng = rng
+        self.restock_hour = restock_hour
+        self.open_hour = open_hour
+        self.close_hour = close_hour
+        self.trip_hours = trip_hours
+        self.queue = EventQueue()
+        # (arrival time, order) of the orders no courier has taken yet
+        self.waiting = deque()
+        # indices into the delivery service's couriers_list of the couriers at the depot
+        self.idle = None
+        self.dispatch_pending = False
+        self.n_events = 0
+        self.n_dispatched = 0
+        self.wait_hours = 0.0
+        self.max_wait_hours = 0.0
+    
+    def run_day(self, model):
+        handlers = (self.restock, self.open, self.order, self.dispatch, self.courier_return, self.expiry)
+        if self.idle is None:
+            self.idle = list(range(len(model.delivery_service.couriers_list)))
+        start = model.curr_day * 24
+        queue = self.queue
+        for medicine_id, countdown in model.request.items():
+            if countdown == 0:
+                queue.push(start + self.restock_hour, RESTOCK, medicine_id)
+        queue.push(start + self.open_hour, OPEN)
+        queue.push(start + 24, EXPIRY)
+        n_events, n_dispatched, wait_hours = 0, self.n_dispatched, self.wait_hours
+        kind = None
+        while kind != EXPIRY:
+            time, _, kind, data = queue.pop()
+            handlers[kind](model, time, data)
+            n_events += 1
+        self.n_events += n_events
+        model.counters['events'] = n_events
+        model.counters['orders_dispatched'] = self.n_dispatched - n_dispatched
+        model.counters['order_wait_hours'] = self.wait_hours - wait_hours
+    
+    def restock(self, model, time, medicine_id):
+        model.restock(medicine_id)
+    
+    def open(self, model, time, _):
+        model.receive_orders()
+        model.add_regular_orders()
+        model.orders_list = list(model.orders_list)
+        model.start_order_lines()
+        span = self.close_hour - self.open_hour
+        random = self.rng.random
+        arrivals = sorted([(time + span * random(), idx) for idx in range(len(model.orders_list))])
+        orders = model.orders_list
+        self.queue.extend_sorted([(arrival, ORDER, orders[idx]) for arrival, idx in arrivals])
+    
+    def order(self, model, time, order):
+        model.handle_order_lines([order])
+        self.waiting.append((time, order))
+        self.schedule_dispatch(model, time)
+    
+    def schedule_dispatch(self, model, time):
+        # a dispatch once a courier is idle or a whole trip waits for a new one; orders arriving at the same time leave
+        # together
+        can_leave = self.idle or len(self.waiting) >= model.delivery_service.max_orders_pc
+        if self.waiting and can_leave and not self.dispatch_pending:
+            self.queue.push(time, DISPATCH)
+            self.dispatch_pending = True
+    
+    def dispatch(self, model, time, _):
+        self.dispatch_pending = False
+        delivery_service = model.delivery_service
+        capacity = delivery_service.max_orders_pc
+        while self.idle and self.waiting:
+            self.send(model, time, self.idle.pop())
+        n_hire = len(self.waiting) // capacity
+        if delivery_service.cap_couriers:
+            n_hire = min(n_hire, max(delivery_service.max_couriers - delivery_service.n_hired_couriers, 0))
+        for _ in range(n_hire):
+            delivery_service.add_courier()
+            self.send(model, time, len(delivery_service.couriers_list) - 1)
+    
+    def send(self, model, time, courier_idx):
+        delivery_service = model.delivery_service
+        courier = delivery_service.couriers_list[courier_idx]
+        trip = [self.waiting.popleft() for _ in range(min(delivery_service.max_orders_pc, len(self.waiting)))]
+        for arrival, _ in trip:
+            wait = time - arrival
+            self.wait_hours += wait
+            self.max_wait_hours = max(self.max_wait_hours, wait)
+        self.n_dispatched += len(trip)
+        if delivery_service.planner is not None:
+            hours = 0.0
+            for route in delivery_service.planner.plan([order.address for _, order in trip]):
+                route_hours = delivery_service.trip_hours(route)
+                courier.assign(route, route_hours)
+                hours += route_hours
+        else:
+            hours = self.trip_hours
+            courier.n_orders_done += len(trip)
+            courier.hours += hours
+        self.queue.push(time + hours, RETURN, (courier_idx, model.curr_day))
+    
+    def courier_return(self, model, time, data):
+        courier_idx, day = data
+        # a courier hired for an earlier day has been let go at its end
+        if courier_idx < model.delivery_service.min_couriers or day == model.curr_day:
+            self.idle.append(courier_idx)
+        self.schedule_dispatch(model, time)
+    
+    def expiry(self, model, time, _):
+        delivery_service = model.delivery_service
+        model.price_orders()
+        model.db['couriers_overloading'][model.curr_day] = delivery_service.get_driven_overloading()
+        if delivery_service.planner is not None:
+            model.db.record_route_lengths(model.curr_day, delivery_service.route_lengths())
+        model.counters['couriers_hired'] = delivery_service.n_hired_couriers - delivery_service.min_couriers
+        model.goto_next_day()
+        self.idle = [x for x in self.idle if x < delivery_service.min_couriers]
+        model.update_quantities()
+        model.request_medicines()
+    
+    def mean_wait_hours(self):
+        return self.wait_hours / self.n_dispatched if self.n_dispatched else 0.0
@@ -0,0 +1,87 @@
+import cProfile
+import json
+import pstats
+from time import perf_counter
+
+
+class Sink:
+    def start_phase(self, day, phase):
+        pass
+    
+    def end_phase(self, day, phase):
+        pass
+    
+    def write(self, record):
+        pass
+    
+    def close(self):
+        pass
+
+
+class MemorySink(Sink):
+    def __init__(self):
+        self.records = []
+    
+    def write(self, record):
+        self.records.append(record)
+
+
+class JsonLinesSink(Sink):
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+    
+    def write(self, record):
+        self.file.write(json.dumps(record) + '\n')
+    
+    def close(self):
+        self.file.close()
+
+
+class ProfileSink(Sink):
+    # accumulates a cProfile capture of one phase over all simulated days
+    def __init__(self, phase, path=None):
+        self.phase = phase
+        self.path = path
+        self.profiler = cProfile.Profile()
+    
+    def start_phase(self, day, phase):
+        if phase == self.phase:
+            self.profiler.enable()
+    
+    def end_phase(self, day, phase):
+        if phase == self.phase:
+            self.profiler.disable()
+    
+    def stats(self):
+        return pstats.Stats(self.profiler)
+    
+    def close(self):
+        if self.path is not None:
+            self.profiler.dump_stats(self.path)
+
+
+class Instrumentation:
+    # times every phase of Model.run_day and passes a record per day with the phase times and the day's
+    # Model.counters to the sinks; a model without instrumentation runs its phases directly
+    def __init__(self, sinks=None):
+        self.sinks = sinks if sinks is not None else [MemorySink()]
+    
+    def run_day(self, model):
+        day = model.curr_day
+        times = {}
+        for phase in model.day_phases():
+            for sink in self.sinks:
+                sink.start_phase(day, phase)
+            start = perf_counter()
+            getattr(model, phase)()
+            times[phase] = perf_counter() - start
+            for sink in self.sinks:
+                sink.end_phase(day, phase)
+        record = {'day': day, 'total': sum(times.values()), 'times': times, 'counters': dict(model.counters)}
+        for sink in self.sinks:
+            sink.write(record)
+        return record
+    
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
@@ -0,0 +1,92 @@
+from array import array
+
+
+class KPIEngine:
+    # incremental financial and service KPIs. Every event adds to the running total of its series, kept per day as a
+    # prefix sum, so both updates and daily, cumulative and rolling window queries are O(1). Events have to come in day
+    # order, a new day carries the totals of the previous one over.
+    series = ('revenue', 'cost', 'write_offs', 'expired_units', 'ordered_units', 'resolved_units')
+    windows = (7, 30)
+    
+    def __init__(self):
+        self.day = 0
+        # totals[name][day]: the sum of the series over days 0..day
+        self.totals = dict([(x, array('d', [0.0])) for x in self.series])
+        # sku -> [received units, sold units, expired units]
+        self.skus = {}
+    
+    def start_day(self, day):
+        if day < self.day:
+            raise ValueError(f'day {day} is before the current day {self.day}')
+        while self.day < day:
+            for totals in self.totals.values():
+                totals.append(totals[-1])
+            self.day += 1
+    
+    def add(self, name, day, value):
+        self.start_day(day)
+        self.totals[name][day] += value
+    
+    def sku_counts(self, sku):
+        counts = self.skus.get(sku)
+        if counts is None:
+            counts = self.skus[sku] = [0, 0, 0]
+        return counts
+    
+    def add_revenue(self, day, amount):
+        self.add('revenue', day, amount)
+    
+    def add_cost(self, day, amount):
+        self.add('cost', day, amount)
+    
+    def add_received(self, sku, units):
+        self.sku_counts(sku)[0] += units
+    
+    def add_line(self, day, sku, ordered_units, resolved_units):
+        # sku is the medicine the line was resolved with, None for a line nothing was found for
+        self.add('ordered_units', day, ordered_units)
+        self.add('resolved_units', day, resolved_units)
+        if sku is not None:
+            self.sku_counts(sku)[1] += resolved_units
+    
+    def add_write_off(self, day, sku, units, value):
+        self.add('expired_units', day, units)
+        self.add('write_offs', day, value)
+        self.sku_counts(sku)[2] += units
+    
+    def total(self, name, day=None):
+        day = self.day if day is None else min(day, self.day)
+        return self.totals[name][day] if day >= 0 else 0.0
+    
+    def window(self, name, window, day=None):
+        # sum over the `window` days ending with `day`
+        day = self.day if day is None else min(day, self.day)
+        return self.total(name, day) - self.total(name, day - window)
+    
+    def daily(self, name, day=None):
+        return self.window(name, 1, day)
+    
+    def stockout_rate(self, ordered_units, resolved_units):
+        return 1 - resolved_units / ordered_units if ordered_units > 0 else 0.0
+    
+    def sell_through(self, sku=None):
+        # sold / received units of a sku, or of every sku
+        if sku is None:
+            return dict([(x, self.sell_through(x)) for x in self.skus])
+        received, sold, _ = self.skus.get(sku, (0, 0, 0))
+        return sold / received if received > 0 else 0.0
+    
+    def period(self, window=None, day=None):
+        # KPIs of the `window` days ending with `day`, of all days up to it without a window
+        window = self.day + 1 if window is None else window
+        values = dict([(x, self.window(x, window, day)) for x in self.series])
+        values['margin'] = values['revenue'] - values['cost']
+        values['stockout_rate'] = self.stockout_rate(values['ordered_units'], values['resolved_units'])
+        return values
+    
+    def summary(self, day=None):
+        summary = {'day': self.day if day is None else day, 'daily': self.period(1, day),
+                   'cumulative': self.period(None, day)}
+        for window in self.windows:
+            summary[f'rolling_{window}'] = self.period(window, day)
+        return summary
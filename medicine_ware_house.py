@@ -1,21 +1,30 @@
-from random import randint
+import heapq
+import sys
+from random import Random
+
+
+class Clock:
+    def __init__(self, day=0):
+        self.day = day
+    
+    def tick(self, days=1):
+        self.day += days
+        return self.day
 
 
 class Stock:
     def __init__(self, elements_set):
         self.elements_set = elements_set
-        self.stock = []
     
     def decrease_ttl(self):
-        for i in range(len(self.stock)):
-            self.stock[i].ttl -= 1
+        raise NotImplementedError()
     
     def get_element_quantities(self, element):
         return self.get_quantities()[element.id()]
     
     def get_quantities(self):
         quantities = dict([(x.id(), 0) for x in self.elements_set])
-        for x in self.stock:
+        for x in self.get_units():
             quantities[x.id()] += 1
         return quantities
     
@@ -28,10 +37,13 @@ class Stock:
         return result
     
     def apply(self, func):
-        return [func(x) for x in self.stock]
+        return [func(x) for x in self.get_units()]
     
     def get_ttl(self):
-        return [x.ttl for x in self.stock]
+        return [x.ttl for x in self.get_units()]
+    
+    def get_units(self):
+        raise NotImplementedError()
     
     def add_element(self, element, quantity):
         raise NotImplementedError()
@@ -47,81 +59,283 @@ class Stock:
 
 
 class SortedStock(Stock):
-    def __init__(self, elements_set):
-        super().__init__(elements_set)
-        self.quantities = dict([(x.id(), 0) for x in elements_set])
+    # units are stored as lots bucketed by absolute expiry day: self.lots[expiry_day][element_id] = count, where days
+    # are measured by self.clock, which may be shared by several stocks. Expiry days of all lots live in a heap (stale
+    # days of emptied lots are skipped lazily) and every element keeps a heap of exactly its own lots' expiry days, so
+    # the cost of an operation depends on the number of lots it touches instead of the number of units in stock.
+    # self.quantities and self.available are maintained on every insert and removal; with debug=True every mutation
+    # is followed by a full recount to check them.
+    def __init__(self, elements_set, debug=False, clock=None):
+        super().__init__(set(elements_set))
+        self.clock = clock if clock is not None else Clock()
+        self.debug = debug
+        # dicts keep elements and available ids in insertion order, which unlike set order does not depend on hashing
+        self.elements = dict([(x.id(), x) for x in elements_set])
+        self.lots = {}
+        self.expiry_days = []
+        self.element_expiry_days = dict([(x, []) for x in self.elements])
+        self.quantities = dict([(x, 0) for x in self.elements])
+        self.available = {}
+    
+    @property
+    def day(self):
+        return self.clock.day
+    
+    def register_element(self, element):
+        element_id = element.id()
+        if element_id in self.elements:
+            return
+        self.elements_set.add(element)
+        self.elements[element_id] = element
+        self.element_expiry_days[element_id] = []
+        self.quantities[element_id] = 0
+    
+    def decrease_ttl(self):
+        # stocks sharing a clock should tick the clock itself once instead
+        self.clock.tick()
+    
+    def get_quantities(self):
+        return self.quantities
+    
+    def get_elements_set(self):
+        return list(self.elements.values())
+    
+    def get_available_elements(self):
+        return list(self.available)
+    
+    def is_available(self, element):
+        return element.id() in self.available
+    
+    def count_quantities(self):
+        quantities = dict([(x, 0) for x in self.elements])
+        for lot in self.lots.values():
+            for element_id, count in lot.items():
+                quantities[element_id] += count
+        return quantities
+    
+    def check_quantities(self):
+        quantities = self.count_quantities()
+        assert quantities == self.quantities, print(f'quantity index is out of sync: {self.quantities} != {quantities}')
+        available = set([x for x, count in quantities.items() if count > 0])
+        assert available == set(self.available), print(f'available index is out of sync: '
+                                                       f'{self.available} != {available}')
+    
+    def get_element_quantities(self, element):
+        return self.quantities.get(element.id(), 0)
+    
+    def get_units(self):
+        for expiry_day in sorted(self.lots):
+            for element_id, count in self.lots[expiry_day].items():
+                yield from [self.make_unit(element_id, expiry_day)] * count
+    
+    def get_lots(self):
+        return [(element_id, expiry_day, count) for expiry_day in sorted(self.lots)
+                for element_id, count in self.lots[expiry_day].items()]
+    
+    def restore_lots(self, lots, available):
+        # fills an empty stock with lots listed in expiry order as by get_lots, which keeps every expiry day list in
+        # heap order. The available ids are kept in their order, as random choices are made over them.
+        for element_id, expiry_day, count in lots:
+            lot = self.lots.get(expiry_day)
+            if lot is None:
+                lot = self.lots[expiry_day] = {}
+                self.expiry_days.append(expiry_day)
+            lot[element_id] = count
+            self.element_expiry_days[element_id].append(expiry_day)
+            self.quantities[element_id] += count
+        self.available = dict.fromkeys(available)
+    
+    def make_unit(self, element_id, expiry_day):
+        return self.elements[element_id].change(ttl=expiry_day - self.day)
+    
+    def first_expiry_day(self):
+        while self.expiry_days and self.expiry_days[0] not in self.lots:
+            heapq.heappop(self.expiry_days)
+        return self.expiry_days[0] if self.expiry_days else None
+    
+    def add_lot(self, element_id, expiry_day, count):
+        assert element_id in self.elements, print(f'{element_id} is unknown to this stock')
+        
+        if count <= 0:
+            return
+        lot = self.lots.get(expiry_day)
+        if lot is None:
+            lot = self.lots[expiry_day] = {}
+            heapq.heappush(self.expiry_days, expiry_day)
+        if element_id not in lot:
+            lot[element_id] = 0
+            heapq.heappush(self.element_expiry_days[element_id], expiry_day)
+        lot[element_id] += count
+        self.quantities[element_id] += count
+        self.available[element_id] = None
+    
+    def add_lots(self, lots):
+        for element_id, expiry_day, count in lots:
+            self.add_lot(element_id, expiry_day, count)
+        if self.debug:
+            self.check_quantities()
+    
+    def remove_lot(self, element_id, expiry_day, count):
+        # lots are always removed from the earliest expiry day of the element
+        lot = self.lots[expiry_day]
+        lot[element_id] -= count
+        self.quantities[element_id] -= count
+        if self.quantities[element_id] == 0:
+            self.available.pop(element_id)
+        if lot[element_id] == 0:
+            del lot[element_id]
+            heapq.heappop(self.element_expiry_days[element_id])
+            if len(lot) == 0:
+                del self.lots[expiry_day]
+    
+    def take_lot(self, element_id, expiry_day, count):
+        self.remove_lot(element_id, expiry_day, count)
+        return [self.make_unit(element_id, expiry_day)] * count
+    
+    def pop_lots(self, before_day):
+        # removes whole buckets expiring before `before_day`, touching only those buckets
+        lots = []
+        expiry_day = self.first_expiry_day()
+        while expiry_day is not None and expiry_day < before_day:
+            for element_id, count in list(self.lots[expiry_day].items()):
+                self.remove_lot(element_id, expiry_day, count)
+                lots.append((element_id, expiry_day, count))
+            expiry_day = self.first_expiry_day()
+        if self.debug:
+            self.check_quantities()
+        return lots
     
     def clear(self):
-        to_del = len([x for x in self.stock if x.ttl <= 0])
-        [self.stock.pop(0) for _ in range(to_del)]
-        self.quantities = self.get_quantities()
+        return sum([count for _, _, count in self.pop_lots(before_day=self.day + 1)])
     
     def add_element(self, element, quantity=1):
-        assert element in self.elements_set, print(f'{element.id()} is unknown to this stock')
-        
-        self.stock = sorted(self.stock + [element] * quantity, key=lambda x: x.ttl)
-        self.quantities = self.get_quantities()
+        self.add_lot(element.id(), self.day + element.ttl, quantity)
+        if self.debug:
+            self.check_quantities()
     
     def add_elements(self, elements):
         assert all([x in self.elements_set for x in elements]), print(f'encountered unknown element')
         
-        self.stock = sorted(self.stock + elements, key=lambda x: x.ttl)
-        self.quantities = self.get_quantities()
+        lots = {}
+        for x in elements:
+            key = (x.id(), self.day + x.ttl)
+            lots[key] = lots.get(key, 0) + 1
+        for (element_id, expiry_day), count in lots.items():
+            self.add_lot(element_id, expiry_day, count)
+        if self.debug:
+            self.check_quantities()
     
     def extract_element(self, element, quantity=1):
-        result = [i for i, x in enumerate(self.stock) if x == element][:quantity]
-        result = [self.stock.pop(result[0]) for _ in result]
-        self.quantities = self.get_quantities()
-        return result, quantity - (quantity - len(result))
+        element_id = element.id()
+        expiry_days = self.element_expiry_days.get(element_id, [])
+        result = []
+        while len(result) < quantity and expiry_days:
+            expiry_day = expiry_days[0]
+            count = min(quantity - len(result), self.lots[expiry_day][element_id])
+            result.extend(self.take_lot(element_id, expiry_day, count))
+        if self.debug:
+            self.check_quantities()
+        return result, len(result)
+    
+    def take_lots(self, element_id, quantity):
+        # removes up to `quantity` units of an element in FEFO order without building the units, returns their lots
+        expiry_days = self.element_expiry_days.get(element_id, [])
+        lots = []
+        while quantity > 0 and expiry_days:
+            expiry_day = expiry_days[0]
+            count = min(quantity, self.lots[expiry_day][element_id])
+            self.remove_lot(element_id, expiry_day, count)
+            lots.append((element_id, expiry_day, count))
+            quantity -= count
+        if self.debug:
+            self.check_quantities()
+        return lots
+    
+    def take(self, element_id, quantity):
+        return sum([count for _, _, count in self.take_lots(element_id, quantity)])
     
     def extract_elements(self, elements):
         result = [self.extract_element(x, quantity=1) for x in elements]
-        self.quantities = self.get_quantities()
+        if self.debug:
+            self.check_quantities()
         return result
     
     def get_top(self, top):
-        result = [self.stock.pop(0) for i in range(top)]
-        self.quantities = self.get_quantities()
+        result = []
+        expiry_day = self.first_expiry_day()
+        while len(result) < top and expiry_day is not None:
+            for element_id, count in list(self.lots[expiry_day].items()):
+                count = min(top - len(result), count)
+                result.extend(self.take_lot(element_id, expiry_day, count))
+                if len(result) == top:
+                    break
+            expiry_day = self.first_expiry_day()
+        if self.debug:
+            self.check_quantities()
         return result
 
 
 class MedicineWareHouse:
-    def __init__(self, medicines_set, min_instances=5):
-        medicines_set = set(medicines_set)
-        self.medicines_set = medicines_set
-        self.stock:SortedStock = SortedStock(elements_set=medicines_set)
-        self.sale_stock:SortedStock = SortedStock(elements_set=medicines_set)
-        self.min_instances = min_instances
+    def __init__(self, medicines_set, sale_ttl=31, debug=False, rng=None):
+        # medicines are kept in id order, so that random choices made over them do not depend on the caller's order
+        medicines_set = sorted(set(medicines_set), key=lambda x: x.id())
+        self.medicines_set = set(medicines_set)
+        self.rng = rng if rng is not None else Random()
+        self.clock = Clock()
+        self.stock:SortedStock = SortedStock(elements_set=medicines_set, debug=debug, clock=self.clock)
+        self.sale_stock:SortedStock = SortedStock(elements_set=medicines_set, debug=debug, clock=self.clock)
+        self.sale_ttl = sale_ttl
+        self.expired = 0
+        self.expired_lots = []
         self.quantities = dict((x.id(), 0) for x in medicines_set)
-        self.medicines_to_request = dict((x.id(), False) for x in medicines_set)
+        # maps every query id get_medicine accepts ('name_None_None', 'name_form_None', 'name_None_dosage' and the full
+        # id) to the medicines it matches
+        self.lookup = {}
+        for medicine in medicines_set:
+            self.index_medicine(medicine)
     
     def get_medicines_set(self):
         return self.stock.get_elements_set()
     
+    def add_medicines(self, medicines):
+        for medicine in medicines:
+            if medicine in self.medicines_set:
+                continue
+            self.medicines_set.add(medicine)
+            self.stock.register_element(medicine)
+            self.sale_stock.register_element(medicine)
+            self.quantities[medicine.id()] = 0
+            self.index_medicine(medicine)
+    
+    def lookup_keys(self, medicine):
+        name, form, dosage = medicine.name, medicine.form, medicine.dosage
+        return set([f'{name}_None_None', f'{name}_{form}_None', f'{name}_None_{dosage}', medicine.id()])
+    
+    def index_medicine(self, medicine):
+        for key in self.lookup_keys(medicine):
+            self.lookup.setdefault(key, []).append(medicine)
+    
+    def find_medicines(self, medicine):
+        medicine_id = medicine if isinstance(medicine, str) else medicine.id()
+        return self.lookup.get(medicine_id, [])
+    
     def get_available_medicines(self):
         return self.stock.get_available_elements(), self.sale_stock.get_available_elements()
     
     def move_to_sale(self):
-        to_move = len([x for x in self.stock.get_ttl() if x < 31])
-        self.sale_stock.add_elements(self.stock.get_top(top=to_move))
+        self.sale_stock.add_lots(self.stock.pop_lots(before_day=self.clock.day + self.sale_ttl))
     
     def add_medicine(self, medicine, quantity=1):
-        self.stock.add_elements([medicine] * quantity)
+        self.stock.add_element(medicine, quantity)
     
     def get_medicine(self, medicine, quantity=1, is_sale=True):
-        if isinstance(medicine, str):
-            name, form, dosage = medicine.split('_')
-            form = None if form == 'None' else form
-            dosage = None if dosage == 'None' else dosage
-            medicine = Medicine(name, form, dosage)
-        
-        medicines = [x for x in self.medicines_set if self.medicine_equality(x, medicine)]
+        medicines = list(self.find_medicines(medicine))
         if len(medicines) == 0:
             return [], 0
         res_quantity = 0
         result = []
         while res_quantity != quantity and len(medicines) > 0:
-            idx = randint(0, len(medicines) - 1)
+            idx = self.rng.randint(0, len(medicines) - 1)
             medicine = medicines.pop(idx)
             new_quantity = quantity - res_quantity
             if is_sale:
@@ -133,27 +347,86 @@ class MedicineWareHouse:
         
         return result, quantity - (quantity - res_quantity)
     
+    def allocate(self, lines):
+        # get_medicine for a whole day of (query, quantity, is_sale) lines: every line sees the stock the lines before
+        # it left and the candidates are drawn at random just as in get_medicine. The fills are counted against the
+        # stock quantities first, then the units taken of every touched medicine are removed from its stock in FEFO
+        # order in one pass. Returns the (medicine id, count) fills of every line, in the order they were taken.
+        taken = {}
+        fills = []
+        for query, quantity, is_sale in lines:
+            stock = self.sale_stock if is_sale else self.stock
+            medicines = list(self.find_medicines(query))
+            line = []
+            res_quantity = 0
+            while res_quantity != quantity and len(medicines) > 0:
+                medicine_id = medicines.pop(self.rng.randint(0, len(medicines) - 1)).id()
+                key = (is_sale, medicine_id)
+                count = min(quantity - res_quantity, stock.quantities[medicine_id] - taken.get(key, 0))
+                if count > 0:
+                    taken[key] = taken.get(key, 0) + count
+                    line.append((medicine_id, count))
+                    res_quantity += count
+            fills.append(line)
+        for (is_sale, medicine_id), count in taken.items():
+            (self.sale_stock if is_sale else self.stock).take(medicine_id, count)
+        return fills
+    
+    def get_catalogue_medicine(self, medicine_id):
+        return self.stock.elements[medicine_id]
+    
+    def get_medicine_quantity(self, medicine_id):
+        return self.stock.quantities[medicine_id] + self.sale_stock.quantities[medicine_id]
+    
+    def check_quantities(self):
+        self.stock.check_quantities()
+        self.sale_stock.check_quantities()
+    
     def update_quantities(self):
-        stock_quantities = self.stock.get_quantities()
-        sale_quantities = self.sale_stock.get_quantities()
         for x in self.quantities:
-            self.quantities[x] = stock_quantities[x] + sale_quantities[x]
-            if self.quantities[x] < self.min_instances:
-                self.medicines_to_request[x] = True
-            else:
-                self.medicines_to_request[x] = False
+            self.quantities[x] = self.get_medicine_quantity(x)
         return self.quantities
     
     def goto_next_day(self):
-        self.stock.decrease_ttl()
-        self.sale_stock.decrease_ttl()
-        self.stock.clear()
-        self.sale_stock.clear()
+        self.clock.tick()
+        # lots of both stocks that expired with the tick
+        self.expired_lots = self.stock.pop_lots(before_day=self.clock.day + 1)
+        self.expired_lots += self.sale_stock.pop_lots(before_day=self.clock.day + 1)
+        self.expired = sum([count for _, _, count in self.expired_lots])
         self.move_to_sale()
         self.update_quantities()
-    
-    def required_medicines(self):
-        return [x for x, v in self.medicines_to_request.items() if v]
+        return self.expired
+    
+    def snapshot(self):
+        # plain data: the catalogue in the stocks' order and the lots of both stocks by medicine id. The catalogue
+        # index, the stocks' heaps and the quantities are rebuilt on restore.
+        return {'day': self.clock.day, 'sale_ttl': self.sale_ttl, 'expired': self.expired,
+                'expired_lots': self.expired_lots, 'catalogue': self.get_medicines_set(),
+                'stock': (self.stock.get_lots(), list(self.stock.available)),
+                'sale_stock': (self.sale_stock.get_lots(), list(self.sale_stock.available))}
+    
+    @classmethod
+    def from_snapshot(cls, snapshot, debug=False, rng=None):
+        # the constructor sorts the medicines by id, the ones add_medicines added later follow in their own order: they
+        # are added the same way after the sorted head of the catalogue, so that the catalogue index lists them as the
+        # snapshot's warehouse did
+        catalogue = snapshot['catalogue']
+        n_sorted = len(catalogue)
+        for i in range(1, len(catalogue)):
+            if catalogue[i].id() < catalogue[i - 1].id():
+                n_sorted = i
+                break
+        warehouse = cls(catalogue[:n_sorted], sale_ttl=snapshot['sale_ttl'], debug=debug, rng=rng)
+        warehouse.add_medicines(catalogue[n_sorted:])
+        warehouse.clock.day = snapshot['day']
+        warehouse.stock.restore_lots(*snapshot['stock'])
+        warehouse.sale_stock.restore_lots(*snapshot['sale_stock'])
+        warehouse.expired = snapshot['expired']
+        warehouse.expired_lots = snapshot['expired_lots']
+        warehouse.update_quantities()
+        if debug:
+            warehouse.check_quantities()
+        return warehouse
     
     def medicine_equality(self, medicine, other):
         eq = medicine.name == other.name
@@ -172,47 +445,136 @@ class MedicineWareHouse:
         return self.quantities
 
 
-class Medicine:
+# string ids of all medicines ever created, interned to small integer sku keys used for hashing and equality
+_medicine_skus = {}
+
+
+class FrozenSlots:
+    __slots__ = ()
+    
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+    
+    def __delattr__(self, key):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+    
+    def set_slots(self, **values):
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+
+
+class Medicine(FrozenSlots):
+    __slots__ = ('name', 'form', 'dosage', 'ttl', 'produced_time', 'sku', '_id')
+    
     def __init__(self, name, form, dosage,
                  ttl=180, produced_time=0):
-        self.name = name
-        self.form = form
-        self.dosage = dosage
-        self.ttl = ttl
-        self.produced_time = produced_time
+        medicine_id = sys.intern('_'.join([str(name), str(form), str(dosage)]))
+        sku = _medicine_skus.get(medicine_id)
+        if sku is None:
+            sku = _medicine_skus[medicine_id] = len(_medicine_skus)
+        self.set_slots(name=name, form=form, dosage=dosage, ttl=ttl, produced_time=produced_time, sku=sku,
+                       _id=medicine_id)
+    
+    def __reduce__(self):
+        # sku keys are process-local, so they are looked up again on unpickling
+        return restore_medicine, (self._id, self.name, self.form, self.dosage, self.ttl, self.produced_time)
     
     def id(self):
-        return '_'.join([str(self.name), str(self.form), str(self.dosage)])
+        return self._id
     
     def __eq__(self, other):
-        return self.id() == other.id()
+        return self.sku == other.sku
     
     def __hash__(self):
-        return str.__hash__(self.id())
+        return self.sku
     
     def change(self, **kwargs):
-        for key, value in kwargs:
-            setattr(self, key, value)
-        return self
+        values = dict(name=self.name, form=self.form, dosage=self.dosage, ttl=self.ttl,
+                      produced_time=self.produced_time)
+        values.update(kwargs)
+        if (values['name'], values['form'], values['dosage']) != (self.name, self.form, self.dosage):
+            return Medicine(**values)
+        # same sku, so the id does not have to be built and interned again
+        medicine = object.__new__(Medicine)
+        medicine.set_slots(sku=self.sku, _id=self._id, **values)
+        return medicine
     
     def __repr__(self):
-        return self.id()
+        return self._id
+
+
+# the slot descriptors' setters write a Medicine's slots directly, past FrozenSlots.__setattr__
+_medicine_slot_setters = tuple([getattr(Medicine, x).__set__ for x in Medicine.__slots__])
 
 
-class Order:
+def restore_medicine(medicine_id, name, form, dosage, ttl, produced_time):
+    # unpickles a Medicine with the id it was pickled with, which spares building the id again
+    medicine_id = sys.intern(medicine_id)
+    sku = _medicine_skus.get(medicine_id)
+    if sku is None:
+        sku = _medicine_skus[medicine_id] = len(_medicine_skus)
+    medicine = object.__new__(Medicine)
+    set_name, set_form, set_dosage, set_ttl, set_produced_time, set_sku, set_id = _medicine_slot_setters
+    set_name(medicine, name)
+    set_form(medicine, form)
+    set_dosage(medicine, dosage)
+    set_ttl(medicine, ttl)
+    set_produced_time(medicine, produced_time)
+    set_sku(medicine, sku)
+    set_id(medicine, medicine_id)
+    return medicine
+
+
+class Order(FrozenSlots):
+    __slots__ = ('phone_number', 'address', 'order', 'discount_id', 'is_sale', 'regular', '_id')
+    
     def __init__(self, phone_number, address, order, discount_id=None, is_sale=True, regular=False):
-        self.phone_number = phone_number
-        self.address = address
-        self.order = order
-        self.discount_id = discount_id
-        self.is_sale = is_sale
-        self.regular = regular
+        self.set_slots(phone_number=phone_number, address=address, order=tuple(order), discount_id=discount_id,
+                       is_sale=is_sale, regular=regular, _id='_'.join([phone_number, address]))
+    
+    def __reduce__(self):
+        return Order, (self.phone_number, self.address, self.order, self.discount_id, self.is_sale, self.regular)
 
     def __repr__(self):
-        return str(self.order)
+        return str(list(self.order))
     
     def id(self):
-        return '_'.join([self.phone_number, self.address])
+        return self._id
+
+
+class OrderBatch:
+    # a day of generated orders kept as columns; Order objects are only built by `build(columns, idx)` when an order is
+    # accessed, while appended orders (e.g. regular ones) are kept as they are
+    def __init__(self, columns, build):
+        self.columns = columns
+        self.build = build
+        self.n_generated = len(columns['is_sale'])
+        self.extra = []
+    
+    def __len__(self):
+        return self.n_generated + len(self.extra)
+    
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('order index out of range')
+        if idx < self.n_generated:
+            return self.build(self.columns, idx)
+        return self.extra[idx - self.n_generated]
+    
+    def __iter__(self):
+        for idx in range(self.n_generated):
+            yield self.build(self.columns, idx)
+        yield from self.extra
+    
+    def append(self, order):
+        self.extra.append(order)
+    
+    def addresses(self):
+        # the orders' addresses in order, read off the columns without building the generated orders
+        book = self.columns['address_book']
+        return [book[x] for x in self.columns['addresses']] + [order.address for order in self.extra]
 
 
 if __name__ == '__main__':
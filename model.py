@@ -1,20 +1,59 @@
-import tkinter as tk
-from collections import defaultdict
-from random import randint, sample, shuffle
-
-from matplotlib import pyplot as plt
+from array import array
+from random import Random
 
 from delivery_service import DeliveryService
-from medicine_ware_house import MedicineWareHouse, Order, Medicine
+from events import IntradayEngine
+from kpi import KPIEngine
+from pricing import Pricing
+from reorder import POLICIES, DemandForecast, MinInstancesPolicy
+from medicine_ware_house import MedicineWareHouse, Order, OrderBatch, Medicine
+from routing import AddressMap, RoutePlanner
+from results_store import RESOLVED, ResultsStore
 
 
 class Model:
+    phases = ('fulfill_request', 'receive_orders', 'add_regular_orders', 'handle_orders', 'deliver_orders',
+              'goto_next_day', 'update_quantities', 'request_medicines')
+    
+    # attributes that are not copied as they are into a snapshot: components with snapshots of their own, caches and
+    # the day's orders, which are rebuilt on the next day
+    snapshot_skip = ('rng', 'np_rng', 'instrumentation', 'db', 'medicine_ware_house', 'delivery_service',
+                     'orders_list', 'medicine_queries', 'day_lines', 'day_orders')
+    
     def __init__(self, medicines_cnt=10, min_couriers_cnt=1, max_couriers_cnt=10,
                  total_days=45, orders_min_cnt=4, orders_cnt_max_diff=15,
-                 extra_cost=0.25, discount=0.05, last_month_discount=0.5):
+                 extra_cost=0.25, discount=0.05, last_month_discount=0.5, cap_couriers=False, seed=None, rng=None,
+                 np_rng=None, instrumentation=None, order_log=None, log_keep_days=20, log_segment_days=None,
+                 reorder_policy=None, routing=None, intraday=False, numpy_pricing=False):
+        # every random draw of the simulation goes through self.rng, so a seed makes runs reproducible; a NumPy
+        # Generator passed as np_rng is used instead for the daily bulk order generation
+        self.rng = rng if rng is not None else Random(seed)
+        self.np_rng = np_rng
+        # with numpy_pricing the day's orders are priced by Pricing.order_incomes_numpy, which matches the plain
+        # pricing up to rounding
+        self.numpy_pricing = numpy_pricing
+        self.instrumentation = instrumentation
+        # with order_log the order lines are streamed to that file and only log_keep_days days stay in memory; with
+        # log_segment_days the log is rotated to a new segment file every log_segment_days days
+        self.order_log = order_log
+        self.log_keep_days = log_keep_days
+        self.log_segment_days = log_segment_days
+        self.counters = {}
+        # a ReorderPolicy or its name in reorder.POLICIES, decides what to restock from a DemandForecast every day; by
+        # default the fixed request_inst_cnt of a medicine once less than medicine_ware_house_min_inst units are left
+        self.reorder_policy = reorder_policy
+        self.forecast_alpha = 0.2
+        # a routing.RoutePlanner method, 'sweep' or 'savings': couriers then drive planned trips between the customer
+        # addresses and the overloading is their work in shifts; by default couriers only count orders
+        self.routing = routing
+        # with intraday a day is run as events by an events.IntradayEngine, which times orders, restocks and courier
+        # trips within the day; otherwise the phases run once a day in order
+        self.intraday = intraday
+        self.events = None
         self.medicines_cnt = medicines_cnt
         self.min_couriers_cnt = min_couriers_cnt
         self.max_couriers_cnt = max_couriers_cnt
+        self.cap_couriers = cap_couriers
         self.total_days = total_days
         self.extra_cost = extra_cost
         self.discount = discount
@@ -28,7 +67,7 @@ class Model:
         self.delivery_service = None
         self.medicine_ware_house = None
         self.orders_min_cnt = orders_min_cnt // self.extra_cost
-        self.orders_max_cnt = self.orders_min_cnt + randint(7, orders_cnt_max_diff)
+        self.orders_max_cnt = self.orders_min_cnt + self.rng.randint(7, orders_cnt_max_diff)
         
         self.medicine_names = ["Белосалик", "Акридерм", "Бепантен", "Декспантенол", "Бетасерк",
                                "Быструмгель", "Кетопрофен", "Диклофенак", "Вольтарен", "Гастрозол",
@@ -63,13 +102,19 @@ class Model:
                                "Алиса", "Дмитрий", "Олег", "Диана", "Света", "Жора"]
         self.n_regular_customers = 7
         streets = ['Воробьевы Горы', 'Мичуринский Проспект', 'Лебедева', 'Менделеева', 'Ломоносовский Проспект']
-        self.customer_addresses = [streets[randint(0, len(streets) - 1)] + f', {randint(0, 100)}' for _ in
-                                   range(100)]
+        # house numbers run from 0 to max_house_number, which is also the end of a street on the routing map
+        self.max_house_number = 100
+        self.customer_addresses = [streets[self.rng.randint(0, len(streets) - 1)] +
+                                   f', {self.rng.randint(0, self.max_house_number)}' for _ in range(100)]
         self.request = None
         self.orders_list = None
+        self.day_lines = None
+        self.day_orders = None
+        self.medicine_queries = None
         self.request_time_min = 1
         self.request_time_max = 3
         self.db = None
+        self.kpi = None
     
     def run(self):
         for day in range(self.total_days):
@@ -77,54 +122,145 @@ class Model:
     
     def init(self):
         self.request = {}
+        self.request_quantities = {}
+        self.day_demand = {}
         self.orders_list = []
+        self.medicine_queries = {}
         self.curr_day = 1
+        self.kpi = KPIEngine()
         self.init_db()
         self.generate_medicine_warehouse()
+        self.forecast = DemandForecast([x.id() for x in self.medicine_ware_house.get_medicines_set()],
+                                       alpha=self.forecast_alpha)
+        if self.reorder_policy is None:
+            self.reorder_policy = MinInstancesPolicy(self.medicine_ware_house_min_inst, self.request_inst_cnt)
+        elif isinstance(self.reorder_policy, str):
+            self.reorder_policy = POLICIES[self.reorder_policy]()
         self.generate_medicines_costs()
         self.generate_regular_customers()
         self.generate_delivery_service()
     
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+    
+    def snapshot(self):
+        # the state between two days as pickled plain data: warehouse lots by medicine id, courier loads, RNG states,
+        # the results store columns and the model's own settings and pending requests. The bytes are immutable, so
+        # any number of branches can be restored from one snapshot.
+        import pickle
+        
+        state = {
+            'model': dict([(k, v) for k, v in vars(self).items() if k not in self.snapshot_skip]),
+            'rng': self.rng.getstate(),
+            'np_rng': self.np_rng.bit_generator.state if self.np_rng is not None else None,
+            'db': self.db.snapshot(),
+            'warehouse': self.medicine_ware_house.snapshot(),
+            'delivery_service': self.delivery_service.snapshot(),
+        }
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    @classmethod
+    def from_snapshot(cls, snapshot, instrumentation=None, **params):
+        # params override the restored settings, e.g. extra_cost or total_days, the number of days run() simulates. A
+        # streaming model goes on streaming to its order log, or to the order_log given
+        import pickle
+        
+        state = pickle.loads(snapshot)
+        model = cls.__new__(cls)
+        model.__dict__.update(state['model'])
+        for key, value in params.items():
+            if key not in model.__dict__:
+                raise TypeError(f'unknown model parameter {key}')
+            setattr(model, key, value)
+        model.instrumentation = instrumentation
+        model.orders_list = []
+        model.day_lines = None
+        model.day_orders = None
+        model.medicine_queries = {}
+        model.rng = Random()
+        model.rng.setstate(state['rng'])
+        model.np_rng = None
+        if state['np_rng'] is not None:
+            import numpy as np
+            bit_generator = getattr(np.random, state['np_rng']['bit_generator'])()
+            bit_generator.state = state['np_rng']
+            model.np_rng = np.random.Generator(bit_generator)
+        model.db = ResultsStore.from_snapshot(state['db'])
+        model.medicine_ware_house = MedicineWareHouse.from_snapshot(state['warehouse'], rng=model.rng)
+        model.delivery_service = DeliveryService.from_snapshot(state['delivery_service'],
+                                                               min_couriers=model.min_couriers_cnt,
+                                                               max_couriers=model.max_couriers_cnt,
+                                                               min_orders_pc=model.min_orders_pc,
+                                                               max_orders_pc=model.max_orders_pc,
+                                                               cap_couriers=model.cap_couriers,
+                                                               planner=model.route_planner())
+        if model.order_log is not None:
+            model.db.resume_log(model.order_log, model.log_segment_days)
+        return model
+    
+    def save_snapshot(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.snapshot())
+    
+    @classmethod
+    def load_snapshot(cls, path, instrumentation=None, **params):
+        with open(path, 'rb') as f:
+            return cls.from_snapshot(f.read(), instrumentation=instrumentation, **params)
+    
     def init_db(self):
-        self.db = {}
+        if self.db is not None:
+            self.db.close()
+        self.db = ResultsStore(total_days=self.total_days, log_path=self.order_log, keep_days=self.log_keep_days,
+                               segment_days=self.log_segment_days)
         self.db['regular_medicines'] = {}
         self.db['discount_ids'] = {}
         self.db['medicines_costs'] = {}
         self.db['ttls'] = {}
-        self.db['incomes'] = {}
-        self.db['expenses'] = {}
-        self.db['couriers_overloading'] = {}
     
     def generate_medicine_warehouse(self):
-        medicines_set = set()
+        medicines_set = {}
         while len(medicines_set) < self.medicines_cnt:
-            medicines_set.add(self.generate_medicine())
-        self.medicine_ware_house:MedicineWareHouse = MedicineWareHouse(medicines_set,
-                                                     min_instances=self.medicine_ware_house_min_inst)
-        for medicine in medicines_set:
+            medicines_set.setdefault(self.generate_medicine())
+        self.stock_medicine_warehouse(list(medicines_set))
+    
+    def stock_medicine_warehouse(self, medicines_set):
+        self.medicine_ware_house:MedicineWareHouse = MedicineWareHouse(medicines_set, rng=self.rng)
+        for medicine in self.medicine_ware_house.get_medicines_set():
+            self.db.add_sku(medicine.id())
             self.medicine_ware_house.add_medicine(medicine, quantity=self.request_inst_cnt)
+            self.kpi.add_received(medicine.id(), self.request_inst_cnt)
         self.medicine_ware_house.update_quantities()
     
     def generate_medicines_costs(self):
         medicines_set = self.medicine_ware_house.get_medicines_set()
         for medicine in medicines_set:
-            self.db['medicines_costs'][medicine.id()] = randint(self.medicine_min_price, self.medicine_max_price)
+            self.db['medicines_costs'][medicine.id()] = self.rng.randint(self.medicine_min_price,
+                                                                         self.medicine_max_price)
+        self.index_medicines_costs()
+    
+    def index_medicines_costs(self):
+        medicines_set = self.medicine_ware_house.get_medicines_set()
+        # catalogue index of every medicine id and the costs in catalogue order, for the batch pricing
+        self.sku_index = dict([(x.id(), i) for i, x in enumerate(medicines_set)])
+        self.unit_costs = [self.db['medicines_costs'][x.id()] for x in medicines_set]
     
     def generate_regular_customers(self):
-        names = sample(self.customer_names, self.n_regular_customers)
-        addresses = sample(self.customer_addresses, self.n_regular_customers)
-        phones, discount_ids = set(), set()
+        names = self.rng.sample(self.customer_names, self.n_regular_customers)
+        addresses = self.rng.sample(self.customer_addresses, self.n_regular_customers)
+        phones, discount_ids = {}, {}
         while len(phones) < len(names):
-            phones.add(self.generate_phone())
+            phones.setdefault(self.generate_phone())
         while len(discount_ids) < len(names):
-            discount_ids.add(self.generate_discount_id())
+            discount_ids.setdefault(self.generate_discount_id())
         phones, discount_ids = list(phones), list(discount_ids)
         medicines_set = self.medicine_ware_house.get_medicines_set()
         for name, address, phone, discount_id in zip(names, addresses, phones, discount_ids):
             regular_medicines = [
-                (medicines_set[randint(0, len(medicines_set) - 1)], randint(1, self.order_max_medicines),
-                 randint(self.medicine_min_period, self.medicine_max_period)) for _ in
-                range(randint(1, self.order_max_medicines_quantity))
+                (medicines_set[self.rng.randint(0, len(medicines_set) - 1)],
+                 self.rng.randint(1, self.order_max_medicines),
+                 self.rng.randint(self.medicine_min_period, self.medicine_max_period)) for _ in
+                range(self.rng.randint(1, self.order_max_medicines_quantity))
             ]
             customer = '_'.join([name, address, phone])
             self.db['regular_medicines'][customer] = regular_medicines
@@ -133,35 +269,61 @@ class Model:
     def generate_delivery_service(self):
         self.delivery_service = DeliveryService(min_couriers=self.min_couriers_cnt, max_couriers=self.max_couriers_cnt,
                                                 min_orders_pc=self.min_orders_pc,
-                                                max_orders_pc=self.max_orders_pc)
+                                                max_orders_pc=self.max_orders_pc, cap_couriers=self.cap_couriers,
+                                                planner=self.route_planner())
+    
+    def route_planner(self):
+        if self.routing is None:
+            return None
+        return RoutePlanner(AddressMap(max_number=self.max_house_number), capacity=self.max_orders_pc,
+                            method=self.routing)
+    
+    def day_phases(self):
+        # an intraday day is one run of the event engine, whose handlers call into the phases
+        return ('run_events',) if self.intraday else self.phases
     
     def run_day(self):
+        if self.instrumentation is not None:
+            return self.instrumentation.run_day(self)
+        if self.intraday:
+            return self.run_events()
         self.fulfill_request()
         self.receive_orders()
         self.add_regular_orders()
         self.handle_orders()
         self.deliver_orders()
         self.goto_next_day()
-        self.medicine_ware_house.update_quantities()
+        self.update_quantities()
         self.request_medicines()
     
+    def run_events(self):
+        if self.events is None:
+            self.events = IntradayEngine(Random(self.rng.getrandbits(32)))
+        self.events.run_day(self)
+    
     def fulfill_request(self):
         for medicine in self.request:
             if self.request[medicine] == 0:
-                self.request[medicine] = -1
-                medicine = self.medicine_by_id(medicine)
-                self.medicine_ware_house.add_medicine(medicine, self.request_inst_cnt)
-                self.db['expenses'][self.curr_day] = self.db['medicines_costs'][medicine.id()] * self.request_inst_cnt
+                self.restock(medicine)
+    
+    def restock(self, medicine_id):
+        self.request[medicine_id] = -1
+        medicine = self.medicine_by_id(medicine_id)
+        quantity = self.request_quantities.pop(medicine_id, self.request_inst_cnt)
+        self.medicine_ware_house.add_medicine(medicine, quantity)
+        cost = self.db['medicines_costs'][medicine_id] * quantity
+        # several restocks may arrive on the same day
+        self.db['expenses'][self.curr_day] = self.db['expenses'].get(self.curr_day, 0) + cost
+        self.kpi.add_cost(self.curr_day, cost)
+        self.kpi.add_received(medicine_id, quantity)
     
     def receive_orders(self):
-        self.db[self.curr_day] = {}
-        self.db[self.curr_day]['quantities'] = dict(self.medicine_ware_house.get_quantities())
-        self.db[self.curr_day]['requests'] = self.get_requests_status()
-        orders_cnt = randint(self.orders_min_cnt, self.orders_max_cnt)
-        self.orders_list = []
-        for _ in range(orders_cnt):
-            order = self.generate_order(is_sale=self.is_sale())
-            self.orders_list.append(order)
+        self.db.start_day(self.curr_day)
+        self.db.record_quantities(self.curr_day, self.medicine_ware_house.get_quantities())
+        self.db.record_requests(self.curr_day, self.request)
+        orders_cnt = self.rng.randint(self.orders_min_cnt, self.orders_max_cnt)
+        self.orders_list = self.generate_orders(orders_cnt)
+        self.counters['orders_generated'] = orders_cnt
     
     def add_regular_orders(self):
         for customer in self.db['regular_medicines']:
@@ -176,64 +338,112 @@ class Model:
                 self.orders_list.append(Order(phone, address, order, discount_id, is_sale=False, regular=True))
     
     def handle_orders(self):
-        daily_income = 0.0
-        orders, orders_cnt = defaultdict(set), defaultdict(int)
-        resolved_orders, resolved_orders_cnt = defaultdict(set), defaultdict(int)
-        for order in self.orders_list:
-            scale = self.last_month_discount if order.is_sale else 1.0
-            income = 0.0
-            discount = 0.0
-            for medicine, quantity in order.order:
-                orders_cnt[medicine.id()] += quantity
-                orders[order.id() + f'+is_saile_{order.is_sale}'].add((medicine, quantity))
-                medicines, quantity = self.medicine_ware_house.get_medicine(medicine.id(), quantity,
-                                                                            is_sale=order.is_sale)
+        # the whole day is allocated against the warehouse at once, then the resolved lines are priced in one batch;
+        # the delivery reads the addresses off the batch, so no order outlives the allocation
+        self.start_order_lines()
+        self.handle_order_lines(self.orders_list)
+        self.price_orders()
+    
+    def start_order_lines(self):
+        # columns of the day's resolved lines and of their orders, priced together by price_orders
+        self.day_lines = dict([(x, array('q')) for x in ('order', 'sku', 'quantity')])
+        self.day_orders = {'scale': array('d'), 'has_discount_id': array('b'), 'regular': array('b')}
+        self.counters['lines_resolved'] = 0
+        self.counters['units_extracted'] = 0
+    
+    def handle_order_lines(self, orders_list):
+        # allocates the lines of orders_list in one batch and adds them to the day's columns. orders_list is iterated
+        # once: an OrderBatch builds each order a single time and only its key, flags and lines are kept for the day
+        records, queries = [], []
+        for order in orders_list:
+            records.append((order.id() + f'+is_saile_{order.is_sale}', order.is_sale, order.discount_id is not None,
+                            order.regular, order.order))
+            queries.extend([(medicine.id(), quantity, order.is_sale) for medicine, quantity in order.order])
+        fills = iter(self.medicine_ware_house.allocate(queries))
+        lines, orders = self.day_lines, self.day_orders
+        resolved_lines, resolved_units = 0, 0
+        for order_key, is_sale, has_discount_id, regular, order in records:
+            idx = len(orders['scale'])
+            orders['scale'].append(self.last_month_discount if is_sale else 1.0)
+            orders['has_discount_id'].append(has_discount_id)
+            orders['regular'].append(regular)
+            for medicine, ordered in order:
+                self.db.log_line(self.curr_day, order_key, medicine, ordered)
+                line = next(fills)
+                quantity = sum([count for _, count in line])
+                # a line filled from several medicines is booked under the first of them
+                medicine_id = line[0][0] if quantity > 0 else None
                 if quantity > 0:
-                    cost = quantity * self.db['medicines_costs'][medicines[0].id()] * scale
-                    income += cost
-                    resolved_orders[order.id() + f'+is_saile_{order.is_sale}'].add((medicines[0].id(), quantity))
-                    resolved_orders_cnt[medicines[0].id()] += quantity
-            income *= (1 + self.extra_cost)
-            if order.discount_id is not None:
-                discount = self.discount
-            elif income > self.big_sum:
-                discount = self.discount_for_big_sum
-            if order.regular:
-                discount = min(self.max_discount, discount + self.discount_for_regular)
-            income = income * (1 - discount)
+                    lines['order'].append(idx)
+                    lines['sku'].append(self.sku_index[medicine_id])
+                    lines['quantity'].append(quantity)
+                    resolved = self.medicine_ware_house.get_catalogue_medicine(medicine_id)
+                    self.db.log_line(self.curr_day, order_key, resolved, quantity, kind=RESOLVED)
+                    resolved_lines += 1
+                    resolved_units += quantity
+                    self.day_demand[medicine_id] = self.day_demand.get(medicine_id, 0) + quantity
+                self.kpi.add_line(self.curr_day, medicine_id, ordered, quantity)
+        self.counters['lines_resolved'] += resolved_lines
+        self.counters['units_extracted'] += resolved_units
+    
+    def price_orders(self):
+        pricing = self.pricing()
+        price = pricing.order_incomes_numpy if self.numpy_pricing else pricing.order_incomes
+        daily_income = 0.0
+        for income in price(self.unit_costs, self.day_lines, self.day_orders):
             daily_income += income
-        orders_cnt['total'] = sum(orders_cnt.values())
-        resolved_orders_cnt['total'] = sum(resolved_orders_cnt.values())
         self.db['incomes'][self.curr_day] = daily_income
-        self.db[self.curr_day]['orders'] = orders
-        self.db[self.curr_day]['resolved_orders'] = resolved_orders
-        self.db[self.curr_day]['orders_cnt'] = orders_cnt
-        self.db[self.curr_day]['resolved_orders_cnt'] = resolved_orders_cnt
+        self.kpi.add_revenue(self.curr_day, daily_income)
+    
+    def pricing(self):
+        return Pricing(self.extra_cost, self.discount, self.big_sum, self.discount_for_big_sum,
+                       self.discount_for_regular, self.max_discount)
     
     def deliver_orders(self):
         self.delivery_service.distribute(self.orders_list)
         self.db['couriers_overloading'][self.curr_day] = self.delivery_service.get_overloading()
+        if self.delivery_service.planner is not None:
+            self.db.record_route_lengths(self.curr_day, self.delivery_service.route_lengths())
+        self.counters['couriers_hired'] = self.delivery_service.n_hired_couriers - self.delivery_service.min_couriers
     
     def goto_next_day(self):
+        day = self.curr_day
         self.curr_day += 1
-        self.medicine_ware_house.goto_next_day()
+        self.counters['units_expired'] = self.medicine_ware_house.goto_next_day()
+        # expiry is written off on the day that ends with it
+        for medicine_id, _, count in self.medicine_ware_house.expired_lots:
+            self.kpi.add_write_off(day, medicine_id, count, count * self.db['medicines_costs'][medicine_id])
         self.delivery_service.goto_next_day()
         for medicine in self.request:
             if self.request[medicine] > 0:
                 self.request[medicine] -= 1
     
+    def update_quantities(self):
+        self.medicine_ware_house.update_quantities()
+    
     def request_medicines(self):
-        required_medicines = self.medicine_ware_house.medicines_to_request
-        for medicine, is_required in required_medicines.items():
-            if is_required:
+        # the policy is evaluated for all medicines at once, medicines with a pending request are not ordered again
+        self.forecast.update(self.day_demand)
+        self.day_demand = {}
+        quantities = self.reorder_policy.evaluate(self.reorder_columns())
+        for medicine, quantity in zip(self.forecast.skus, quantities):
+            if quantity > 0:
                 if medicine not in self.request or self.request[medicine] == -1:
-                    self.request[medicine] = randint(self.request_time_min, self.request_time_max)
-    
-    def medicine_by_id_rand(self, medicine: str):
-        name, form, dosage = medicine.split('_')
-        form = form if sample([True, False], 1)[0] else None
-        dosage = dosage if sample([True, False], 1)[0] else None
-        return Medicine(name, form, dosage)
+                    self.request[medicine] = self.rng.randint(self.request_time_min, self.request_time_max)
+                    self.request_quantities[medicine] = quantity
+    
+    def reorder_columns(self):
+        skus = self.forecast.skus
+        quantities = self.medicine_ware_house.quantities
+        return {
+            'skus': skus,
+            'on_hand': [quantities[x] for x in skus],
+            'demand': list(self.forecast.level),
+            'sigma': self.forecast.sigma(),
+            'unit_cost': [self.db['medicines_costs'][x] for x in skus],
+            'ttl': [self.db['ttls'][x] for x in skus],
+            'lead_time': (self.request_time_min + self.request_time_max) / 2,
+        }
     
     def medicine_by_id(self, id):
         name, form, dosage = id.split('_')
@@ -242,274 +452,138 @@ class Model:
         ttl = self.db['ttls'][id]
         return Medicine(name, form, dosage, ttl, self.curr_day)
     
-    def is_sale(self):
-        idx = 0 if randint(1, 100) > 35 else 1
-        return [True, False][idx]
-    
-    def generate_order(self, is_sale=True, from_available=True):
-        customer, discount_id = self.generate_customer()
-        name, address, phone = customer.split('_')
+    def generate_orders(self, orders_cnt, from_available=True):
+        # draws all of the day's orders at once against a single availability snapshot, see OrderBatch
+        catalogue = self.medicine_ware_house.get_medicines_set()
+        catalogue_idx = dict([(x.id(), i) for i, x in enumerate(catalogue)])
+        pools = [[], []]
         if from_available:
-            stock_medicines_set, sale_medicines_set = self.medicine_ware_house.get_available_medicines()
-            medicines_set = stock_medicines_set if not is_sale else sale_medicines_set
-            if len(medicines_set) == 0:
-                medicines_set = [x.id() for x in self.medicine_ware_house.get_medicines_set()]
+            pools = [[catalogue_idx[x] for x in medicines_set]
+                     for medicines_set in self.medicine_ware_house.get_available_medicines()]
+        # pools[is_sale]: catalogue indices an order may pick from, all medicines if none is available
+        pools = [pool if len(pool) > 0 else list(range(len(catalogue))) for pool in pools]
+        if self.np_rng is not None:
+            columns = self.draw_orders_numpy(orders_cnt, pools)
         else:
-            medicines_set = [x.id() for x in self.medicine_ware_house.get_medicines_set()]
-        medicines_set = [self.medicine_by_id_rand(x) for x in medicines_set]
-        shuffle(medicines_set)
-        ordered_medicines = medicines_set[:randint(0, min(self.order_max_medicines, len(medicines_set) - 1)) + 1]
-        quantities = [randint(1, self.order_max_medicines_quantity) for _ in range(len(ordered_medicines))]
-        order = [(x, c) for x, c in zip(ordered_medicines, quantities)]
+            columns = self.draw_orders(orders_cnt, pools)
+        columns['catalogue'] = catalogue
+        columns['address_book'] = self.customer_addresses
+        return OrderBatch(columns, self.build_order)
+    
+    def draw_orders(self, orders_cnt, pools):
+        rng = self.rng
+        is_sale = [rng.randint(1, 100) > 35 for _ in range(orders_cnt)]
+        names = [rng.randrange(len(self.customer_names)) for _ in range(orders_cnt)]
+        addresses = [rng.randrange(len(self.customer_addresses)) for _ in range(orders_cnt)]
+        phones = [self.digits_to_int(rng.sample(range(0, 10), 10)) for _ in range(orders_cnt)]
+        discount_ids = [self.digits_to_int(rng.sample(range(0, 10), 5))
+                        if (rng.randint(1, 100) / 100) < self.discount_id_probability else -1
+                        for _ in range(orders_cnt)]
+        offsets, medicines = [0], []
+        for order_is_sale in is_sale:
+            pool = pools[order_is_sale]
+            n_medicines = rng.randint(0, min(self.order_max_medicines, len(pool) - 1)) + 1
+            medicines.extend(rng.sample(pool, n_medicines))
+            offsets.append(len(medicines))
+        masks = [rng.getrandbits(2) for _ in range(len(medicines))]
+        quantities = [rng.randint(1, self.order_max_medicines_quantity) for _ in range(len(medicines))]
+        return dict(is_sale=is_sale, names=names, addresses=addresses, phones=phones, discount_ids=discount_ids,
+                    offsets=offsets, medicines=medicines, masks=masks, quantities=quantities)
+    
+    def draw_orders_numpy(self, orders_cnt, pools):
+        import numpy as np
         
-        return Order(phone, address, order, discount_id, is_sale)
-    
-    def generate_customer(self):
-        name = self.customer_names[randint(0, len(self.customer_names) - 1)]
-        address = self.customer_addresses[randint(0, len(self.customer_addresses) - 1)]
-        phone_number = self.generate_phone()
-        customer = '_'.join([name, address, phone_number])
+        rng = self.np_rng
+        is_sale = rng.integers(1, 101, orders_cnt) > 35
+        names = rng.integers(0, len(self.customer_names), orders_cnt)
+        addresses = rng.integers(0, len(self.customer_addresses), orders_cnt)
+        powers = 10 ** np.arange(9, -1, -1, dtype=np.int64)
+        digits = np.tile(np.arange(10, dtype=np.int64), (orders_cnt, 1))
+        phones = rng.permuted(digits, axis=1) @ powers
+        discount_ids = rng.permuted(digits, axis=1)[:, :5] @ powers[5:]
+        has_discount_id = rng.integers(1, 101, orders_cnt) / 100 < self.discount_id_probability
+        discount_ids = np.where(has_discount_id, discount_ids, -1)
+        
+        max_medicines = min(self.order_max_medicines, max(len(x) for x in pools) - 1) + 1
+        picked = np.zeros((orders_cnt, max_medicines), dtype=np.int64)
+        counts = np.zeros(orders_cnt, dtype=np.int64)
+        for order_is_sale, pool in enumerate(pools):
+            rows = np.flatnonzero(is_sale == bool(order_is_sale))
+            n_medicines = min(self.order_max_medicines, len(pool) - 1) + 1
+            counts[rows] = rng.integers(0, n_medicines, len(rows)) + 1
+            # Floyd's sampling of n_medicines distinct pool positions per order, shuffled to a uniform order
+            positions = np.empty((len(rows), n_medicines), dtype=np.int64)
+            for i, j in enumerate(range(len(pool) - n_medicines, len(pool))):
+                t = rng.integers(0, j + 1, len(rows))
+                seen = (positions[:, :i] == t[:, None]).any(axis=1)
+                positions[:, i] = np.where(seen, j, t)
+            positions = rng.permuted(positions, axis=1)
+            picked[rows, :n_medicines] = np.asarray(pool, dtype=np.int64)[positions]
+        medicines = picked[np.arange(max_medicines) < counts[:, None]]
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        masks = rng.integers(0, 4, len(medicines))
+        quantities = rng.integers(1, self.order_max_medicines_quantity + 1, len(medicines))
+        return dict(is_sale=is_sale.tolist(), names=names.tolist(), addresses=addresses.tolist(),
+                    phones=phones.tolist(), discount_ids=discount_ids.tolist(), offsets=offsets.tolist(),
+                    medicines=medicines.tolist(), masks=masks.tolist(), quantities=quantities.tolist())
+    
+    def build_order(self, columns, idx):
+        name = self.customer_names[columns['names'][idx]]
+        address = columns['address_book'][columns['addresses'][idx]]
+        phone = f"+7{columns['phones'][idx]:010d}"
+        discount_id = columns['discount_ids'][idx]
+        discount_id = None if discount_id < 0 else f'{discount_id:05d}'
+        customer = '_'.join([name, address, phone])
         if customer in self.db['regular_medicines']:
             discount_id = self.db['discount_ids'][customer]
-        else:
-            discount_id = self.generate_discount_id(random=True)
-        
-        return '_'.join([name, address, phone_number]), discount_id
+        order = []
+        for line in range(columns['offsets'][idx], columns['offsets'][idx + 1]):
+            medicine = self.medicine_query(columns['catalogue'][columns['medicines'][line]], columns['masks'][line])
+            order.append((medicine, columns['quantities'][line]))
+        return Order(phone, address, order, discount_id, columns['is_sale'][idx])
+    
+    def medicine_query(self, medicine, mask):
+        # the medicine as a customer asks for it: bit 0 of the mask keeps the form, bit 1 keeps the dosage
+        key = (medicine.id(), mask)
+        if key not in self.medicine_queries:
+            self.medicine_queries[key] = Medicine(medicine.name, medicine.form if mask & 1 else None,
+                                                  medicine.dosage if mask & 2 else None)
+        return self.medicine_queries[key]
+    
+    def digits_to_int(self, digits):
+        result = 0
+        for x in digits:
+            result = result * 10 + x
+        return result
     
     def generate_medicine(self, medicines_set=None):
         if medicines_set is None:
-            name = self.medicine_names[randint(0, len(self.medicine_names) - 1)]
-            form = self.medicine_forms[randint(0, len(self.medicine_forms) - 1)]
-            dosage = str(randint(self.medicine_min_dosage, self.medicine_max_dosage))
+            name = self.medicine_names[self.rng.randint(0, len(self.medicine_names) - 1)]
+            form = self.medicine_forms[self.rng.randint(0, len(self.medicine_forms) - 1)]
+            dosage = str(self.rng.randint(self.medicine_min_dosage, self.medicine_max_dosage))
             medicine = '_'.join([name, form, dosage])
             if medicine not in self.db['ttls']:
-                ttl = randint(self.medicine_min_ttl, self.medicine_max_ttl)
+                ttl = self.rng.randint(self.medicine_min_ttl, self.medicine_max_ttl)
                 self.db['ttls'][medicine] = ttl
             else:
                 ttl = self.db['ttls'][medicine]
             produced_time = self.curr_day
             return Medicine(name, form, dosage, ttl, produced_time)
         else:
-            return [x.change(produced_time=self.curr_day) for x in medicines_set][randint(0, len(medicines_set) - 1)]
-    
-    def get_requests_status(self):
-        requests = []
-        for key, value in self.request.items():
-            if value != -1:
-                requests.append(':'.join([str(key), str(value)]))
-        return requests
+            medicines_set = [x.change(produced_time=self.curr_day) for x in medicines_set]
+            return medicines_set[self.rng.randint(0, len(medicines_set) - 1)]
     
     def generate_phone(self):
-        return '+7' + ''.join([str(x) for x in sample(range(0, 10), 10)])
+        return '+7' + ''.join([str(x) for x in self.rng.sample(range(0, 10), 10)])
     
     def generate_discount_id(self, random=True):
         if random:
-            idx = 1 if (randint(1, 100) / 100) < self.discount_id_probability else 0
+            idx = 1 if (self.rng.randint(1, 100) / 100) < self.discount_id_probability else 0
             return [None, self.generate_discount_id(random=False)][idx]
         
-        return ''.join([str(x) for x in sample(range(0, 10), 5)])
-
-
-class Child(tk.Toplevel):
-    def __init__(self, root, picture):
-        super().__init__(root)
-        self.title(u'Графики моделирования')
-        
-        self.img = tk.PhotoImage(file=picture)
-        h, w = self.img.height(), self.img.width()
-        
-        self.geometry(f'{w}x{h + 30}+300+200')
-        self.resizable(True, True)
-        self.grab_set()
-        self.focus_set()
-        
-        self.canvas = tk.Canvas(self, width=w, height=h)
-        self.canvas.pack()
-        self.canvas.create_image(0, 0, image=self.img, anchor=tk.NW)
-        self.button_exit = tk.Button(self, text='Exit', width=50, command=self.exit, fg='darkred')
-        self.button_exit.pack()
-    
-    def exit(self):
-        self.destroy()
-
-
-class Application(tk.Frame):
-    def __init__(self, root, model):
-        super().__init__(root)
-        self.root = root
-        self.bg = 'lightgreen'
-        self.text_bg = 'lightblue'
-        self.root.configure(bg=self.bg)
-        self.model = model
-        self.tmp_file = 'tmp_plot.png'
-        
-        self.build_gui()
-    
-    def params_widgets(self):
-        l_bg = 'lightgrey'
-        self.params_frame = tk.Frame(self.upper_root, borderwidth=1, relief=tk.SUNKEN, bg='lightgrey')
-        self.params_frame.pack(side=tk.RIGHT)
-        self.params_total_days = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
-                                          from_=20, to=180, tickinterval=30, resolution=10, bd=2)
-        self.params_extra_cost = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
-                                          from_=0.01, to=1.0, tickinterval=0.2, resolution=0.01, bd=2)
-        self.params_discount = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
-                                        from_=0.01, to=0.07, tickinterval=0.03, resolution=0.01, bd=2)
-        self.params_medicines_cnt = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
-                                             from_=10, to=100, tickinterval=15, resolution=1, bd=2)
-        self.params_couriers_cnt = tk.Scale(self.params_frame, orient=tk.HORIZONTAL, length=200,
-                                            from_=5, to=20, tickinterval=5, resolution=1, bd=2)
-        self.params_total_days_l = tk.Label(self.params_frame, text='колич. дней:', font='Arial 18', bg=l_bg,
-                                            fg='black')
-        self.params_extra_cost_l = tk.Label(self.params_frame, text=u'наценка:', font='Arial 18', bg=l_bg,
-                                            fg='black')
-        self.params_discount_l = tk.Label(self.params_frame, text=u'скидка:', font='Arial 18', bg=l_bg,
-                                          fg='black')
-        self.params_medicines_cnt_l = tk.Label(self.params_frame, text=u'колич. лекарств:', font='Arial 18',
-                                               bg=l_bg, fg='black')
-        self.params_couriers_cnt_l = tk.Label(self.params_frame, text=u'макс. колич. курьеров:', font='Arial 18',
-                                              bg=l_bg, fg='black')
-        padx = 0
-        self.params_total_days.grid(row=0, column=1, padx=padx)
-        self.params_total_days_l.grid(row=0, column=0, padx=padx)
-        self.params_extra_cost.grid(row=1, column=1, padx=padx)
-        self.params_extra_cost_l.grid(row=1, column=0, padx=padx)
-        self.params_discount.grid(row=2, column=1, padx=padx)
-        self.params_discount_l.grid(row=2, column=0, padx=padx)
-        self.params_medicines_cnt.grid(row=3, column=1, padx=padx)
-        self.params_medicines_cnt_l.grid(row=3, column=0, padx=padx)
-        self.params_couriers_cnt.grid(row=4, column=1, padx=padx)
-        self.params_couriers_cnt_l.grid(row=4, column=0, padx=padx)
-    
-    def com_widgets(self):
-        fg = 'blue'
-        button_w = 25
-        
-        self.com_frame = tk.Frame(self.upper_root, height=240, borderwidth=1, relief=tk.FLAT, bg='lightgrey')
-        self.com_frame.pack(side=tk.LEFT, padx=15)
-        self.button_launch = tk.Button(self.com_frame, width=button_w, text='Запустить', fg=fg, command=self.run)
-        # self.button_launch.grid(row=0, column=1, pady=10)
-        self.button_next_day = tk.Button(self.com_frame, text='Следующий день', fg=fg, command=self.run_day,
-                                         width=button_w)
-        # self.button_next_day.grid(row=1, column=1, pady=10)
-        self.button_show_overloading = tk.Button(self.com_frame, text='Показать перегрузку', fg=fg,
-                                                 command=self.show_overloading, width=button_w)
-        self.button_show_logs = tk.Button(self.com_frame, text='Показать логи', fg=fg, command=self.show_logs,
-                                          width=button_w)
-        # self.button_show_logs.grid(row=2, column=1, pady=10)
-        self.button_show_incomes = tk.Button(self.com_frame, text='Показать прибыль', fg=fg,
-                                             command=self.show_incomes, width=button_w)
-        # self.button_show_incomes.grid(row=3, column=1, pady=10)
-        self.button_show_expenses = tk.Button(self.com_frame, text='Показать убыль', fg=fg,
-                                              command=self.show_expenses, width=button_w)
-        # self.button_show_expenses.grid(row=4, column=1, pady=10)
-        self.button_show_available = tk.Button(self.com_frame, text='Показать доступные лекарства', fg=fg,
-                                               command=self.show_available_meds, width=button_w)
-        self.button_clear = tk.Button(self.com_frame, text='Очистить', fg=fg, command=self.clear_output, width=button_w)
-        self.button_exit = tk.Button(self.com_frame, text='Выйти', fg=fg, command=self.exit, width=button_w)
-        padx, pady = 0, 5
-        self.button_launch.pack(padx=padx, pady=pady)
-        self.button_next_day.pack(padx=padx, pady=pady)
-        self.button_show_overloading.pack(padx=padx, pady=pady)
-        self.button_show_logs.pack(padx=padx, pady=pady)
-        self.button_show_incomes.pack(padx=padx, pady=pady)
-        self.button_show_expenses.pack(padx=padx, pady=pady)
-        self.button_show_available.pack(padx=padx, pady=pady)
-        self.button_clear.pack(padx=padx, pady=pady)
-        self.button_exit.pack(padx=padx, pady=pady)
-    
-    def build_gui(self):
-        self.model.init()
-        self.upper_root = tk.Frame(self.root, bg=self.bg)
-        self.upper_root.grid(row=0)
-        self.lower_root = tk.Frame(self.root)
-        self.lower_root.grid(row=1)
-        self.params_widgets()
-        self.com_widgets()
-        self.text = tk.Text(self.lower_root, bd=1, relief=tk.RAISED, font=('times', 14), wrap=tk.WORD, bg=self.text_bg,
-                            width=77)
-        self.text.pack(padx=0)
-    
-    def clear_output(self):
-        self.text.delete('1.0', tk.END)
-    
-    def update_model(self):
-        medicines_cnt = int(self.params_medicines_cnt.get())
-        extra_cost = float(self.params_extra_cost.get())
-        total_days = int(self.params_total_days.get())
-        discount = float(self.params_discount.get())
-        max_couriers_cnt = int(self.params_couriers_cnt.get())
-        self.model.medicines_cnt = medicines_cnt
-        self.model.extra_cost = extra_cost
-        self.model.total_days = total_days
-        self.model.discount = discount
-        self.model.max_couriers_cnt = max_couriers_cnt
-    
-    def run(self):
-        self.clear_output()
-        self.update_model()
-        self.model.init()
-        self.text.insert(1.0, f'Происходит моделирование на длительность {self.model.total_days} дней ...\n')
-        self.model.run()
-        self.text.insert(tk.END, 'Моделирование завершилось!\n')
-    
-    def run_day(self):
-        self.update_model()
-        self.text.insert(tk.END, f'Моделирование за {self.model.curr_day}-й день ...\n')
-        self.model.run_day()
-        self.text.insert(tk.END, 'Моделирование завершилось!\n')
-    
-    def show_overloading(self):
-        self.generate_plot(self.model.db['couriers_overloading'], 'день', 'количество курьеров')
-        Child(self.lower_root, self.tmp_file)
-    
-    def show_available_meds(self):
-        text = '\n'.join(
-            [':'.join([x, str(c)]) for x, c in self.model.medicine_ware_house.get_quantities().items() if c > 0]) + '\n'
-        self.clear_output()
-        self.text.insert(1.0, text)
-    
-    def generate_plot(self, data, xlabel, ylabel):
-        keys = [i + 1 for i in range(max(data.keys()))]
-        values = [data[k] if k in data else 0 for k in keys]
-        plt.plot(keys, values)
-        plt.xlabel(xlabel=xlabel)
-        plt.ylabel(ylabel=ylabel, labelpad=-1)
-        plt.ylim(bottom=0)
-        plt.savefig(self.tmp_file, dpi=140, height=100, width=120)
-        plt.close('all')
-    
-    def show_logs(self):
-        self.clear_output()
-        for i in range(max(self.model.curr_day - 20, 1), self.model.curr_day):
-            orders_text = '\n'.join([': '.join([k, '\n\t' + '\n\t'.join([f'{x}:{y}' for x, y in v])]) for k, v in
-                                     self.model.db[i]['orders'].items()])
-            orders_text = f'\nORDERS [day: {i + 1}]\n{orders_text}\n'
-            resolved_orders_text = '\n'.join(
-                [': '.join([k, '\n\t' + '\n\t'.join([f'{x}:{y}' for x, y in v])]) for k, v in
-                 self.model.db[i]['resolved_orders'].items()])
-            resolved_orders_text = f'\nRESOLVED ORDERS [day: {i + 1}]\n{resolved_orders_text}\n'
-            self.text.insert(tk.END, orders_text)
-            self.text.insert(tk.END, resolved_orders_text)
-    
-    def show_incomes(self):
-        self.generate_plot(self.model.db['incomes'], 'день', 'прибыль')
-        Child(self.root, self.tmp_file)
-    
-    def show_expenses(self):
-        self.generate_plot(self.model.db['expenses'], 'день', 'убыль')
-        Child(self.root, self.tmp_file)
-    
-    def exit(self):
-        self.clear_output()
-        self.root.destroy()
+        return ''.join([str(x) for x in self.rng.sample(range(0, 10), 5)])
 
 
 if __name__ == '__main__':
-    root, model = tk.Tk(), Model()
-    application = Application(root, model)
-    
-    root.title('Аптека')
-    root.geometry('680x750+300+20')
-    root.resizable(True, False)
-    root.mainloop()
+    from application import main
+    main()
@@ -0,0 +1,270 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+from kpi import KPIEngine
+from medicine_ware_house import Medicine
+from model import Model
+
+
+class Branch(Model):
+    # a Model whose catalogue, prices and customer addresses are given by the network, so that all branches stock the
+    # same medicines and every order of a branch comes from an address routed to it
+    def __init__(self, catalogue, costs, addresses, max_house_number, **params):
+        super().__init__(**params)
+        self.catalogue = catalogue
+        self.costs = costs
+        self.customer_addresses = list(addresses)
+        # the network's number range, so that all branches share one routing map
+        self.max_house_number = max_house_number
+    
+    def generate_medicine_warehouse(self):
+        medicines_set = [Medicine(name, form, dosage, ttl, self.curr_day) for name, form, dosage, ttl in self.catalogue]
+        for medicine in medicines_set:
+            self.db['ttls'][medicine.id()] = medicine.ttl
+        self.stock_medicine_warehouse(medicines_set)
+    
+    def generate_medicines_costs(self):
+        self.db['medicines_costs'].update(self.costs)
+        self.index_medicines_costs()
+    
+    def step(self, incoming, outgoing, transfer_below, transfer_keep):
+        # one day between two network synchronisations: receive the lots shipped to the branch the day before, ship
+        # the transfers the network asked for from the main stock, simulate the day and report its metrics together
+        # with the medicines the branch is short of and the ones it has to spare. Transferred units count as received
+        # by the receiver and no longer as received by the donor, so that the sell-through stays per branch.
+        stock = self.medicine_ware_house.stock
+        stock.add_lots(incoming)
+        for sku, _, count in incoming:
+            self.kpi.add_received(sku, count)
+        shipments = [(receiver, sku, stock.take_lots(sku, units)) for receiver, sku, units in outgoing]
+        for _, sku, lots in shipments:
+            self.kpi.add_received(sku, -sum([count for _, _, count in lots]))
+        self.medicine_ware_house.update_quantities()
+        day = self.curr_day
+        self.run_day()
+        quantities = self.medicine_ware_house.quantities
+        pending = set([x for x, countdown in self.request.items() if countdown != -1])
+        return {
+            'day': day,
+            'kpi': self.kpi.period(1, day),
+            'overloading': self.db['couriers_overloading'][day],
+            'shipments': shipments,
+            'needs': [(x, transfer_keep - q) for x, q in quantities.items() if q < transfer_below and x not in pending],
+            'surplus': dict([(x, q - transfer_keep) for x, q in quantities.items() if q > transfer_keep]),
+        }
+
+
+class Shard:
+    # the branches one worker simulates
+    def __init__(self, branches):
+        self.branches = dict([(idx, Branch(**params)) for idx, params in branches])
+        for branch in self.branches.values():
+            branch.init()
+    
+    def step(self, inputs, transfer_below, transfer_keep):
+        return dict([(idx, self.branches[idx].step(*inputs[idx], transfer_below, transfer_keep))
+                     for idx in self.branches])
+    
+    def summaries(self):
+        return dict([(idx, branch.kpi.period()) for idx, branch in self.branches.items()])
+
+
+def shard_worker(connection, branches):
+    # serves ('step', inputs, transfer_below, transfer_keep) and ('summaries',) requests until it receives None
+    shard = Shard(branches)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        connection.send(getattr(shard, message[0])(*message[1:]))
+    connection.close()
+
+
+class LocalWorker:
+    # a shard in this process behind the interface of a worker process
+    def __init__(self, branches):
+        self.shard = Shard(branches)
+        self.result = None
+    
+    def send(self, message):
+        self.result = getattr(self.shard, message[0])(*message[1:])
+    
+    def recv(self):
+        return self.result
+    
+    def close(self):
+        pass
+
+
+class ProcessWorker:
+    def __init__(self, branches):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=shard_worker, args=(child_connection, branches), daemon=True)
+        self.process.start()
+        child_connection.close()
+    
+    def send(self, message):
+        self.connection.send(message)
+    
+    def recv(self):
+        return self.connection.recv()
+    
+    def close(self):
+        self.connection.send(None)
+        self.process.join()
+        self.connection.close()
+
+
+class Network:
+    # branches of one pharmacy network sharing a catalogue and prices. Customer addresses are split between the
+    # branches in contiguous blocks of the sorted addresses, so every address is routed to one branch and neighbouring
+    # addresses to the same one. Branches are spread over `workers` processes (0 runs them in this process) which
+    # only synchronise at day boundaries: every worker simulates a day of its branches, then the network matches the
+    # branches short of a medicine with the ones having more than transfer_keep units of it. Transfers are shipped from
+    # the donor's stock at the start of the next day and arrive the day after. The network KPIs aggregate the branches'.
+    # Every branch has a seed of its own, so the results do not depend on the number of workers.
+    streets = ['Воробьевы Горы', 'Мичуринский Проспект', 'Лебедева', 'Менделеева', 'Ломоносовский Проспект']
+    
+    def __init__(self, n_branches=4, workers=0, seed=None, total_days=45, medicines_cnt=10, addresses_per_branch=100,
+                 transfer_below=15, transfer_keep=40, **params):
+        self.n_branches = n_branches
+        self.seed = seed
+        self.total_days = total_days
+        self.transfer_below = transfer_below
+        self.transfer_keep = transfer_keep
+        rng = random.Random(seed)
+        # the catalogue and prices are drawn by a template model
+        template = Model(medicines_cnt=medicines_cnt, total_days=total_days, rng=rng, **params)
+        template.init()
+        catalogue = [(x.name, x.form, x.dosage, x.ttl) for x in template.medicine_ware_house.get_medicines_set()]
+        costs = dict(template.db['medicines_costs'])
+        template.close()
+        # house numbers go up to 100 per branch, or further for the addresses to be drawn from twice as many
+        max_number = max(100 * n_branches, 2 * n_branches * addresses_per_branch // len(self.streets))
+        addresses = set()
+        while len(addresses) < n_branches * addresses_per_branch:
+            addresses.add(f'{self.streets[rng.randrange(len(self.streets))]}, {rng.randint(0, max_number)}')
+        addresses = sorted(addresses, key=lambda x: (x.split(', ')[0], int(x.split(', ')[1])))
+        self.routes = dict([(x, i * n_branches // len(addresses)) for i, x in enumerate(addresses)])
+        branches = [(idx, dict(catalogue=catalogue, costs=costs, max_house_number=max_number,
+                               addresses=[x for x in addresses if self.routes[x] == idx],
+                               seed=random.Random(f'{seed}_{idx}').getrandbits(32), medicines_cnt=medicines_cnt,
+                               total_days=total_days, **params)) for idx in range(n_branches)]
+        n_workers = max(min(workers, n_branches), 1)
+        shards = [branches[i::n_workers] for i in range(n_workers)]
+        worker_class = ProcessWorker if workers > 0 else LocalWorker
+        self.workers = [(worker_class(shard), [idx for idx, _ in shard]) for shard in shards]
+        self.incoming = dict([(idx, []) for idx in range(n_branches)])
+        self.outgoing = dict([(idx, []) for idx in range(n_branches)])
+        # (receiver, medicine id) of the transfers that have not arrived yet, and of the ones shipped to the receivers
+        # for their next step
+        self.in_transit = set()
+        self.arriving = set()
+        self.kpi = KPIEngine()
+        self.overloading = dict([(idx, {}) for idx in range(n_branches)])
+        self.n_transfers = 0
+        self.units_transferred = 0
+    
+    def run(self):
+        for _ in range(self.total_days):
+            self.run_day()
+    
+    def run_day(self):
+        for worker, branches in self.workers:
+            inputs = dict([(idx, (self.incoming[idx], self.outgoing[idx])) for idx in branches])
+            worker.send(('step', inputs, self.transfer_below, self.transfer_keep))
+        reports = {}
+        for worker, _ in self.workers:
+            reports.update(worker.recv())
+        # the receivers have taken in the lots shipped the day before, their reports count them
+        self.in_transit -= self.arriving
+        self.arriving = set()
+        self.incoming = dict([(idx, []) for idx in range(self.n_branches)])
+        for idx in range(self.n_branches):
+            report = reports[idx]
+            for name in KPIEngine.series:
+                self.kpi.add(name, report['day'], report['kpi'][name])
+            self.overloading[idx][report['day']] = report['overloading']
+            for receiver, sku, lots in report['shipments']:
+                # a donor may have sold the units meanwhile and ship less or nothing
+                self.incoming[receiver].extend(lots)
+                self.arriving.add((receiver, sku))
+                self.units_transferred += sum([count for _, _, count in lots])
+        self.outgoing = self.match_transfers(reports)
+    
+    def match_transfers(self, reports):
+        # the needs of the branches in branch order are served by the donors in branch order
+        outgoing = dict([(idx, []) for idx in range(self.n_branches)])
+        surplus = dict([(idx, dict(reports[idx]['surplus'])) for idx in range(self.n_branches)])
+        for receiver in range(self.n_branches):
+            for sku, units in reports[receiver]['needs']:
+                if (receiver, sku) in self.in_transit:
+                    continue
+                for donor in range(self.n_branches):
+                    spare = surplus[donor].get(sku, 0)
+                    if donor == receiver or spare <= 0:
+                        continue
+                    count = min(spare, units)
+                    surplus[donor][sku] = spare - count
+                    outgoing[donor].append((receiver, sku, count))
+                    self.in_transit.add((receiver, sku))
+                    self.n_transfers += 1
+                    units -= count
+                    if units == 0:
+                        break
+        return outgoing
+    
+    def branch_summaries(self):
+        summaries = {}
+        for worker, _ in self.workers:
+            worker.send(('summaries',))
+            summaries.update(worker.recv())
+        return summaries
+    
+    def summary(self):
+        return {'network': self.kpi.period(), 'transfers': self.n_transfers,
+                'units_transferred': self.units_transferred,
+                'branches': dict([(str(idx), kpis) for idx, kpis in sorted(self.branch_summaries().items())])}
+    
+    def close(self):
+        for worker, _ in self.workers:
+            worker.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run a network of pharmacy branches in parallel worker processes.')
+    parser.add_argument('--branches', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=0, help='worker processes, 0 runs the branches in this one')
+    parser.add_argument('--total-days', type=int, default=45)
+    parser.add_argument('--medicines-cnt', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--transfer-below', type=int, default=15)
+    parser.add_argument('--transfer-keep', type=int, default=40)
+    parser.add_argument('--output', default=None, help='JSON file for the network summary, stdout by default')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    network = Network(n_branches=args.branches, workers=args.workers, seed=args.seed, total_days=args.total_days,
+                      medicines_cnt=args.medicines_cnt, transfer_below=args.transfer_below,
+                      transfer_keep=args.transfer_keep)
+    network.run()
+    elapsed = time.perf_counter() - start
+    summary = network.summary()
+    network.close()
+    summary['branch_days_per_second'] = args.branches * args.total_days / elapsed
+    text = json.dumps(summary, indent=1)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import os
+
+
+def segment_path(path, segment, segment_days):
+    return f'{path}.{segment:04d}' if segment_days else path
+
+
+class OrderLogWriter:
+    # order lines are appended as tab separated `day order_key medicine_id quantity kind` lines through a write
+    # buffer; with segment_days a new segment file is started every segment_days days. The index of where every day
+    # starts is kept in memory and written to `path.index` on close. Given the index of a closed log, the writer
+    # appends to that log instead of starting a new one.
+    def __init__(self, path, segment_days=None, buffer_size=1 << 16, index=None):
+        self.path = path
+        self.segment_days = segment_days
+        self.buffer_size = buffer_size
+        self.index = list(index) if index else []
+        self.segment = self.index[-1][1] if self.index else 0
+        self.segment_days_written = len([x for x in self.index if x[1] == self.segment])
+        self.file = open(segment_path(path, self.segment, segment_days), 'ab' if self.index else 'wb',
+                         buffering=buffer_size)
+    
+    def start_day(self, day):
+        if self.segment_days and self.segment_days_written == self.segment_days:
+            self.file.close()
+            self.segment += 1
+            self.segment_days_written = 0
+            self.file = open(segment_path(self.path, self.segment, self.segment_days), 'wb',
+                             buffering=self.buffer_size)
+        self.index.append((day, self.segment, self.file.tell()))
+        self.segment_days_written += 1
+    
+    def write(self, day, order_key, medicine_id, quantity, kind):
+        self.file.write(f'{day}\t{order_key}\t{medicine_id}\t{quantity}\t{kind}\n'.encode('utf-8'))
+    
+    def flush(self):
+        self.file.flush()
+    
+    def close(self):
+        self.file.close()
+        with open(f'{self.path}.index', 'w', encoding='utf-8') as f:
+            f.write(f'{self.segment_days or 0}\n')
+            for day, segment, offset in self.index:
+                f.write(f'{day}\t{segment}\t{offset}\n')
+
+
+class OrderLogReader:
+    # replays day ranges of an order log lazily, seeking straight to the first line of every requested day. The days
+    # before the log's first one are replayed from `previous`, the reader of the log it continues, if any.
+    def __init__(self, path, index=None, segment_days=None, previous=None):
+        self.path = path
+        self.segment_days = segment_days
+        self.previous = previous
+        self.index = index
+        if index is None:
+            with open(f'{path}.index', encoding='utf-8') as f:
+                self.segment_days = int(f.readline()) or None
+                self.index = [tuple([int(x) for x in line.split('\t')]) for line in f]
+    
+    def days(self):
+        own_days = [day for day, _, _ in self.index]
+        if self.previous is None:
+            return own_days
+        return [x for x in self.previous.days() if not own_days or x < own_days[0]] + own_days
+    
+    def replay(self, first_day, last_day=None):
+        last_day = first_day if last_day is None else last_day
+        if self.previous is not None:
+            own_first = self.index[0][0] if self.index else last_day + 1
+            if first_day < own_first:
+                yield from self.previous.replay(first_day, min(last_day, own_first - 1))
+        files = {}
+        try:
+            for day, segment, offset in self.index:
+                if not first_day <= day <= last_day:
+                    continue
+                if segment not in files:
+                    path = segment_path(self.path, segment, self.segment_days)
+                    if not os.path.exists(path):
+                        continue
+                    files[segment] = open(path, 'rb')
+                f = files[segment]
+                f.seek(offset)
+                for line in f:
+                    record_day, order_key, medicine_id, quantity, kind = line.decode('utf-8').rstrip('\n').split('\t')
+                    if int(record_day) != day:
+                        break
+                    yield day, order_key, medicine_id, int(quantity), int(kind)
+        finally:
+            for f in files.values():
+                f.close()
@@ -0,0 +1,45 @@
+class Pricing:
+    # prices a day of resolved order lines in bulk: the lines' costs are summed per order, marked up by extra_cost and
+    # reduced by the order's discount tier, which is the discount-id discount, else the big-sum discount, plus the
+    # regular customers' discount up to max_discount. Lines are given as columns: the order they belong to, the sku
+    # index into unit_costs and the resolved quantity; orders by their price scale and discount flags. Columns may be
+    # lists or arrays.
+    def __init__(self, extra_cost, discount, big_sum, discount_for_big_sum, discount_for_regular, max_discount):
+        self.extra_cost = extra_cost
+        self.discount = discount
+        self.big_sum = big_sum
+        self.discount_for_big_sum = discount_for_big_sum
+        self.discount_for_regular = discount_for_regular
+        self.max_discount = max_discount
+    
+    def order_incomes(self, unit_costs, lines, orders):
+        incomes = [0.0] * len(orders['scale'])
+        for order, sku, quantity in zip(lines['order'], lines['sku'], lines['quantity']):
+            incomes[order] += quantity * unit_costs[sku] * orders['scale'][order]
+        result = []
+        for income, has_discount_id, regular in zip(incomes, orders['has_discount_id'], orders['regular']):
+            income *= (1 + self.extra_cost)
+            discount = 0.0
+            if has_discount_id:
+                discount = self.discount
+            elif income > self.big_sum:
+                discount = self.discount_for_big_sum
+            if regular:
+                discount = min(self.max_discount, discount + self.discount_for_regular)
+            result.append(income * (1 - discount))
+        return result
+    
+    def order_incomes_numpy(self, unit_costs, lines, orders):
+        import numpy as np
+        
+        # array columns are read without a copy
+        order = np.asarray(lines['order'], dtype=np.int64)
+        costs = np.asarray(unit_costs, dtype=np.float64)[np.asarray(lines['sku'], dtype=np.int64)]
+        scales = np.asarray(orders['scale'], dtype=np.float64)[order]
+        values = np.asarray(lines['quantity'], dtype=np.float64) * costs * scales
+        incomes = np.bincount(order, weights=values, minlength=len(orders['scale'])) * (1 + self.extra_cost)
+        discounts = np.where(np.asarray(orders['has_discount_id'], dtype=bool), self.discount,
+                             np.where(incomes > self.big_sum, self.discount_for_big_sum, 0.0))
+        discounts = np.where(np.asarray(orders['regular'], dtype=bool),
+                             np.minimum(self.max_discount, discounts + self.discount_for_regular), discounts)
+        return (incomes * (1 - discounts)).tolist()
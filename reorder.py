@@ -0,0 +1,106 @@
+import math
+from array import array
+
+
+class DemandForecast:
+    # exponentially smoothed daily demand and mean absolute deviation of every sku, updated once a day with the units
+    # of the day's resolved orders. The first day initialises the level.
+    def __init__(self, skus, alpha=0.2):
+        self.skus = list(skus)
+        self.alpha = alpha
+        self.level = array('d', bytes(8 * len(self.skus)))
+        self.deviation = array('d', bytes(8 * len(self.skus)))
+        self.n_days = 0
+    
+    def update(self, demand):
+        # demand: sku -> units of the day, skus that are not in it had none
+        alpha = self.alpha
+        units = [demand.get(x, 0) for x in self.skus]
+        if self.n_days == 0:
+            self.level = array('d', units)
+        else:
+            errors = [abs(x - level) for x, level in zip(units, self.level)]
+            self.deviation = array('d', [alpha * e + (1 - alpha) * d for e, d in zip(errors, self.deviation)])
+            self.level = array('d', [alpha * x + (1 - alpha) * level for x, level in zip(units, self.level)])
+        self.n_days += 1
+    
+    def sigma(self):
+        # standard deviation of a normal demand from its mean absolute deviation
+        return [1.25 * x for x in self.deviation]
+
+
+class ReorderPolicy:
+    # decides for all skus at once how many units to order. columns hold a list with one value per sku, all in the same
+    # order: skus, on_hand, demand (forecast daily units), sigma, unit_cost and ttl, plus the expected lead_time in days
+    def evaluate(self, columns):
+        raise NotImplementedError
+
+
+class MinInstancesPolicy(ReorderPolicy):
+    # the original rule: a fixed quantity once the stock drops below min_instances
+    def __init__(self, min_instances=5, quantity=66):
+        self.min_instances = min_instances
+        self.quantity = quantity
+    
+    def evaluate(self, columns):
+        return [self.quantity if x < self.min_instances else 0 for x in columns['on_hand']]
+
+
+class SSPolicy(ReorderPolicy):
+    # (s, S): once the stock drops below s, order up to S. Both are units, the same for all skus or a dict by sku.
+    def __init__(self, s=5, S=66):
+        self.s = s
+        self.S = S
+    
+    def levels(self, level, skus):
+        return [level[x] for x in skus] if isinstance(level, dict) else [level] * len(skus)
+    
+    def evaluate(self, columns):
+        skus = columns['skus']
+        return [S - x if x < s else 0
+                for x, s, S in zip(columns['on_hand'], self.levels(self.s, skus), self.levels(self.S, skus))]
+
+
+class ReorderPointPolicy(ReorderPolicy):
+    # reorders once the stock falls to the demand expected until a new order could arrive plus z standard deviations
+    # of safety stock, and orders up to that point plus cover_days of demand. Orders never exceed the demand over the
+    # medicine's shelf life, so slow movers are not bought to expire. The forecast only sees resolved units, so a sku
+    # that ran out looks like it has no demand; min_stock keeps reordering it.
+    def __init__(self, z=1.65, review_days=1, cover_days=7, min_stock=5, min_quantity=10):
+        self.z = z
+        self.review_days = review_days
+        self.cover_days = cover_days
+        self.min_stock = min_stock
+        self.min_quantity = min_quantity
+    
+    def reorder_points(self, columns):
+        horizon = columns['lead_time'] + self.review_days
+        return [max(d * horizon + self.z * sigma * math.sqrt(horizon), self.min_stock)
+                for d, sigma in zip(columns['demand'], columns['sigma'])]
+    
+    def order_sizes(self, columns, reorder_points):
+        return [rop - x + d * self.cover_days
+                for x, d, rop in zip(columns['on_hand'], columns['demand'], reorder_points)]
+    
+    def evaluate(self, columns):
+        reorder_points = self.reorder_points(columns)
+        sizes = self.order_sizes(columns, reorder_points)
+        return [max(math.ceil(min(size, d * ttl)), self.min_quantity) if x <= rop else 0
+                for x, rop, size, d, ttl in zip(columns['on_hand'], reorder_points, sizes, columns['demand'],
+                                                columns['ttl'])]
+
+
+class EOQPolicy(ReorderPointPolicy):
+    # lead-time reorder points with the economic order quantity sqrt(2 * demand * order_cost / holding cost), where
+    # holding a unit for a day costs holding_rate of its price
+    def __init__(self, order_cost=500.0, holding_rate=0.001, z=1.65, review_days=1, min_stock=5, min_quantity=10):
+        super().__init__(z=z, review_days=review_days, min_stock=min_stock, min_quantity=min_quantity)
+        self.order_cost = order_cost
+        self.holding_rate = holding_rate
+    
+    def order_sizes(self, columns, reorder_points):
+        return [math.sqrt(2 * d * self.order_cost / (self.holding_rate * cost)) if cost > 0 else 0.0
+                for d, cost in zip(columns['demand'], columns['unit_cost'])]
+
+
+POLICIES = {'min_instances': MinInstancesPolicy, 'ss': SSPolicy, 'reorder_point': ReorderPointPolicy, 'eoq': EOQPolicy}
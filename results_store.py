@@ -0,0 +1,423 @@
+import os
+import sys
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+
+from order_log import OrderLogReader, OrderLogWriter
+
+ORDERED, RESOLVED = 0, 1
+# typecodes of a day's order line columns: order and medicine are table indices, kind is ORDERED or RESOLVED
+LOG_TYPES = {'order': 'i', 'medicine': 'i', 'quantity': 'q', 'kind': 'b'}
+BYTE_ORDER = '<' if sys.byteorder == 'little' else '>'
+NPY_DESCR = {'d': BYTE_ORDER + 'f8', 'q': BYTE_ORDER + 'i8', 'b': '|i1'}
+
+
+def npy_bytes(descr, shape, data):
+    # .npy format version 1.0: magic, header length, a dict literal padded to a multiple of 64 bytes, raw data
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': {tuple(shape)}, }}"
+    header += ' ' * (63 - (len(header) + 10) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header.encode('latin1') + data
+
+
+def npy_strings(strings):
+    width = max([len(x) for x in strings] + [1])
+    data = b''.join([x.ljust(width, '\0').encode('utf-32-le') for x in strings])
+    return npy_bytes(f'<U{width}', (len(strings),), data)
+
+
+def npy_array(values, shape=None):
+    if sys.byteorder == 'big' and values.typecode != 'b':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return npy_bytes(NPY_DESCR[values.typecode], shape or (len(values),), values.tobytes())
+
+
+def array_bytes(values):
+    return values.typecode, values.tobytes()
+
+
+def bytes_array(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    return values
+
+
+class Table:
+    # interns values to consecutive indices. A table restored from its values builds its index when it is first used,
+    # which the days read back from a snapshot never do.
+    def __init__(self):
+        self.values = []
+        self.keys = None
+        self._index = {}
+    
+    @classmethod
+    def from_values(cls, values, keys=None):
+        table = cls()
+        table.values = list(values)
+        table.keys = keys
+        table._index = None
+        return table
+    
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = dict(zip(self.values if self.keys is None else self.keys, range(len(self.values))))
+            self.keys = None
+        return self._index
+    
+    def add(self, value, key=None):
+        key = value if key is None else key
+        index = self.index
+        idx = index.get(key)
+        if idx is None:
+            idx = index[key] = len(self.values)
+            self.values.append(value)
+        return idx
+
+
+class DayColumn(Mapping):
+    # one number per day, preallocated and grown on demand; days that were never written are not in the mapping. An
+    # integer ('q') column turns into a float one the first time a value that is not an integer is written to it.
+    def __init__(self, size, typecode='d'):
+        self.data = array(typecode, bytes(8 * size))
+        self.written = array('b', bytes(size))
+    
+    def reserve(self, size):
+        if size > len(self.data):
+            size = max(size, 2 * len(self.data))
+            self.data.extend(array(self.data.typecode, bytes(8 * (size - len(self.data)))))
+            self.written.extend(array('b', bytes(size - len(self.written))))
+    
+    def __setitem__(self, day, value):
+        self.reserve(day + 1)
+        if self.data.typecode == 'q' and not isinstance(value, int):
+            self.data = array('d', self.data)
+        self.data[day] = value
+        self.written[day] = 1
+    
+    def __getitem__(self, day):
+        if day in self:
+            return self.data[day]
+        raise KeyError(day)
+    
+    def __contains__(self, day):
+        return isinstance(day, int) and 0 <= day < len(self.written) and self.written[day] == 1
+    
+    def __iter__(self):
+        return (day for day, written in enumerate(self.written) if written)
+    
+    def __len__(self):
+        return sum(self.written)
+
+
+class DayView(Mapping):
+    # read adapter giving db[day] the layout of the former nested dict
+    keys_ = ('quantities', 'requests', 'orders', 'resolved_orders', 'orders_cnt', 'resolved_orders_cnt')
+    
+    def __init__(self, store, day):
+        self.store = store
+        self.day = day
+    
+    def __getitem__(self, key):
+        if key not in self.keys_:
+            raise KeyError(key)
+        return getattr(self.store, f'get_{key}')(self.day)
+    
+    def __iter__(self):
+        return iter(self.keys_)
+    
+    def __len__(self):
+        return len(self.keys_)
+
+
+class ResultsStore:
+    # per-day metrics live in DayColumns, per-SKU quantities in a flat days x skus array, ordered and resolved order
+    # lines, pending requests and the km driven by routed couriers in append-only record columns. Other string keys
+    # hold the model's static dicts and db[day] reads a day back in the layout of the former nested dict.
+    # With log_path the order lines are also streamed to an order log on disk and only the last keep_days days of them
+    # are kept in memory; older days are replayed from the log when they are read.
+    metrics = ('incomes', 'expenses', 'couriers_overloading')
+    # expenses and courier counts are whole numbers unless e.g. routed couriers report their work in shifts
+    metric_types = {'incomes': 'd', 'expenses': 'q', 'couriers_overloading': 'q'}
+    
+    def __init__(self, total_days=0, skus=(), log_path=None, keep_days=20, segment_days=None):
+        self.size = total_days + 2
+        self.meta = {}
+        self.columns = dict([(x, DayColumn(self.size, self.metric_types[x])) for x in self.metrics])
+        self.skus = Table()
+        self.quantities = array('q')
+        self.quantities_written = array('b', bytes(self.size))
+        self.medicines = Table()
+        # day -> the day's order lines, with the day's order keys interned in a table of their own
+        self.log = {}
+        self.keep_days = keep_days
+        self.log_writer = OrderLogWriter(log_path, segment_days) if log_path is not None else None
+        # set on a store restored from a snapshot of a streaming store, reads back the days evicted before it
+        self.log_reader = None
+        self.requests = dict([(x, array('q')) for x in ('day', 'sku', 'countdown')])
+        self.routes = {'day': array('q'), 'courier': array('q'), 'km': array('d')}
+        # days in the order they were started and where their request and route records start
+        self.days = {}
+        self.requests_starts = array('q')
+        self.routes_starts = array('q')
+        for sku in skus:
+            self.add_sku(sku)
+    
+    def __getstate__(self):
+        # the order log stays with the store writing it, a restored store reads the evicted days back from the log
+        # files written so far and keeps its new days in memory until it streams them with resume_log
+        state = dict(self.__dict__)
+        state['log_reader'] = self.get_log_reader()
+        state['log_writer'] = None
+        return state
+    
+    def snapshot(self):
+        # the store as plain data: arrays as raw bytes, tables as their values and the order keys of a day joined in
+        # one string. Table indices are rebuilt on restore and the order log is left to the store writing it, as in
+        # __getstate__. The static dicts are shared with the store until the snapshot is pickled.
+        return {
+            'size': self.size, 'keep_days': self.keep_days, 'meta': self.meta,
+            'columns': dict([(x, (array_bytes(column.data), array_bytes(column.written)))
+                             for x, column in self.columns.items()]),
+            'skus': self.skus.values, 'medicines': self.medicines.values,
+            'quantities': array_bytes(self.quantities), 'quantities_written': array_bytes(self.quantities_written),
+            'log': [(day, dict([(x, array_bytes(lines[x])) for x in LOG_TYPES]),
+                     '\n'.join(lines['order_keys'].values)) for day, lines in self.log.items()],
+            'log_reader': self.get_log_reader(),
+            'requests': dict([(x, array_bytes(values)) for x, values in self.requests.items()]),
+            'routes': dict([(x, array_bytes(values)) for x, values in self.routes.items()]),
+            'days': self.days,
+            'requests_starts': array_bytes(self.requests_starts), 'routes_starts': array_bytes(self.routes_starts),
+        }
+    
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        store = cls.__new__(cls)
+        store.size = snapshot['size']
+        store.keep_days = snapshot['keep_days']
+        store.meta = snapshot['meta']
+        store.columns = {}
+        for name, (data, written) in snapshot['columns'].items():
+            column = store.columns[name] = DayColumn.__new__(DayColumn)
+            column.data, column.written = bytes_array(*data), bytes_array(*written)
+        store.skus = Table.from_values(snapshot['skus'])
+        store.medicines = Table.from_values(snapshot['medicines'], [x.id() for x in snapshot['medicines']])
+        store.quantities = bytes_array(*snapshot['quantities'])
+        store.quantities_written = bytes_array(*snapshot['quantities_written'])
+        store.log = {}
+        for day, columns, order_keys in snapshot['log']:
+            lines = store.log[day] = dict([(x, bytes_array(*data)) for x, data in columns.items()])
+            lines['order_keys'] = Table.from_values(order_keys.split('\n') if order_keys else [])
+        store.log_writer = None
+        store.log_reader = snapshot['log_reader']
+        store.requests = dict([(x, bytes_array(*data)) for x, data in snapshot['requests'].items()])
+        store.routes = dict([(x, bytes_array(*data)) for x, data in snapshot['routes'].items()])
+        store.days = snapshot['days']
+        store.requests_starts = bytes_array(*snapshot['requests_starts'])
+        store.routes_starts = bytes_array(*snapshot['routes_starts'])
+        return store
+    
+    def resume_log(self, path, segment_days=None):
+        # streams the new days of a store restored from a snapshot and evicts the old ones again. A path of the
+        # snapshot's own log continues that log, which the store that wrote it must have closed; another path starts
+        # a log of its own, e.g. for every branch forked from one snapshot, that reads the older days from the
+        # snapshot's log.
+        reader = self.log_reader
+        if reader is not None and os.path.abspath(reader.path) == os.path.abspath(path):
+            self.log_writer = OrderLogWriter(path, reader.segment_days, index=reader.index)
+            self.log_reader = reader.previous
+        else:
+            self.log_writer = OrderLogWriter(path, segment_days)
+            if reader is None:
+                # a store that did not stream has its days only in memory, they start the new log
+                for day in list(self.log):
+                    self.log_writer.start_day(day)
+                    for _, order_key, medicine, quantity, kind in self.replay_log(day):
+                        self.log_writer.write(day, order_key, medicine.id(), quantity, kind)
+        while len(self.log) > self.keep_days:
+            del self.log[next(iter(self.log))]
+    
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            if key not in self.days:
+                raise KeyError(key)
+            return DayView(self, key)
+        if key in self.columns:
+            return self.columns[key]
+        return self.meta[key]
+    
+    def __setitem__(self, key, value):
+        if key in self.columns or isinstance(key, int):
+            raise KeyError(f'{key} is written through the store methods')
+        self.meta[key] = value
+    
+    def __contains__(self, key):
+        return key in self.days if isinstance(key, int) else key in self.columns or key in self.meta
+    
+    def add_sku(self, sku):
+        n_skus = len(self.skus.values)
+        if self.skus.add(sku) == n_skus and n_skus > 0 and len(self.quantities) > 0:
+            # re-layout the quantities for the wider row, catalogue changes are rare
+            rows = [self.quantities[i:i + n_skus] for i in range(0, len(self.quantities), n_skus)]
+            self.quantities = array('q')
+            for row in rows:
+                self.quantities.extend(row)
+                self.quantities.append(0)
+    
+    def start_day(self, day):
+        self.days[day] = len(self.requests_starts)
+        self.requests_starts.append(len(self.requests['day']))
+        self.routes_starts.append(len(self.routes['day']))
+        self.log[day] = dict([(x, array(typecode)) for x, typecode in LOG_TYPES.items()], order_keys=Table())
+        if self.log_writer is not None:
+            self.log_writer.start_day(day)
+            while len(self.log) > self.keep_days:
+                del self.log[next(iter(self.log))]
+    
+    def record_quantities(self, day, quantities):
+        n_skus = len(self.skus.values)
+        if len(self.quantities) < (day + 1) * n_skus:
+            size = max(day + 1, 2 * len(self.quantities) // n_skus, self.size)
+            self.quantities.extend(array('q', bytes(8 * (size * n_skus - len(self.quantities)))))
+            self.quantities_written.extend(array('b', bytes(max(size - len(self.quantities_written), 0))))
+        self.quantities[day * n_skus:(day + 1) * n_skus] = array('q', map(quantities.__getitem__, self.skus.values))
+        self.quantities_written[day] = 1
+    
+    def record_requests(self, day, request):
+        for sku, countdown in request.items():
+            if countdown != -1:
+                self.requests['day'].append(day)
+                self.requests['sku'].append(self.skus.index[sku])
+                self.requests['countdown'].append(countdown)
+    
+    def record_route_lengths(self, day, lengths):
+        # km driven by every courier on the day, by courier index
+        for courier, km in enumerate(lengths):
+            self.routes['day'].append(day)
+            self.routes['courier'].append(courier)
+            self.routes['km'].append(km)
+    
+    def log_line(self, day, order_key, medicine, quantity, kind=ORDERED):
+        lines = self.log[day]
+        lines['order'].append(lines['order_keys'].add(order_key))
+        lines['medicine'].append(self.medicines.add(medicine, medicine.id()))
+        lines['quantity'].append(quantity)
+        lines['kind'].append(kind)
+        if self.log_writer is not None:
+            self.log_writer.write(day, order_key, medicine.id(), quantity, kind)
+    
+    def day_records(self, starts, columns, day):
+        position = self.days[day]
+        end = starts[position + 1] if position + 1 < len(starts) else len(columns['day'])
+        return range(starts[position], end)
+    
+    def get_quantities(self, day):
+        n_skus = len(self.skus.values)
+        if day >= len(self.quantities_written) or not self.quantities_written[day]:
+            return {}
+        return dict(zip(self.skus.values, self.quantities[day * n_skus:(day + 1) * n_skus]))
+    
+    def get_requests(self, day):
+        return [':'.join([str(self.skus.values[self.requests['sku'][i]]), str(self.requests['countdown'][i])])
+                for i in self.day_records(self.requests_starts, self.requests, day)]
+    
+    def get_route_lengths(self, day):
+        return [self.routes['km'][i] for i in self.day_records(self.routes_starts, self.routes, day)]
+    
+    def replay_log(self, first_day, last_day=None):
+        # (day, order key, medicine, quantity, kind) records of a day range, read lazily from disk for evicted days
+        last_day = first_day if last_day is None else last_day
+        for day in [x for x in self.days if first_day <= x <= last_day]:
+            if day in self.log:
+                lines = self.log[day]
+                for i in range(len(lines['kind'])):
+                    yield (day, lines['order_keys'].values[lines['order'][i]],
+                           self.medicines.values[lines['medicine'][i]], lines['quantity'][i], lines['kind'][i])
+            elif self.log_writer is not None or self.log_reader is not None:
+                for _, order_key, medicine_id, quantity, kind in self.get_log_reader().replay(day):
+                    yield day, order_key, self.medicines.values[self.medicines.index[medicine_id]], quantity, kind
+    
+    def get_log_reader(self):
+        if self.log_writer is None:
+            return self.log_reader
+        self.log_writer.flush()
+        return OrderLogReader(self.log_writer.path, list(self.log_writer.index), self.log_writer.segment_days,
+                              previous=self.log_reader)
+    
+    def get_lines(self, day, kind):
+        for _, order_key, medicine, quantity, line_kind in self.replay_log(day):
+            if line_kind == kind:
+                yield order_key, medicine, quantity
+    
+    def get_orders(self, day):
+        orders = defaultdict(set)
+        for order_key, medicine, quantity in self.get_lines(day, ORDERED):
+            orders[order_key].add((medicine, quantity))
+        return orders
+    
+    def get_resolved_orders(self, day):
+        resolved_orders = defaultdict(set)
+        for order_key, medicine, quantity in self.get_lines(day, RESOLVED):
+            resolved_orders[order_key].add((medicine.id(), quantity))
+        return resolved_orders
+    
+    def count_lines(self, day, kind):
+        counts = defaultdict(int)
+        for _, medicine, quantity in self.get_lines(day, kind):
+            counts[medicine.id()] += quantity
+        counts['total'] = sum(counts.values())
+        return counts
+    
+    def get_orders_cnt(self, day):
+        return self.count_lines(day, ORDERED)
+    
+    def get_resolved_orders_cnt(self, day):
+        return self.count_lines(day, RESOLVED)
+    
+    def to_dict(self):
+        db = dict(self.meta)
+        for name, column in self.columns.items():
+            db[name] = dict(column)
+        for day in sorted(self.days):
+            db[day] = dict(DayView(self, day))
+        # only routed runs record route lengths
+        if len(self.routes['day']) > 0:
+            db['route_lengths'] = dict([(day, self.get_route_lengths(day)) for day in sorted(self.days)])
+        return db
+    
+    def save_npz(self, path):
+        import zipfile
+        
+        n_skus = len(self.skus.values)
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as f:
+            for name, column in self.columns.items():
+                f.writestr(f'{name}.npy', npy_array(column.data))
+                f.writestr(f'{name}_written.npy', npy_array(column.written))
+            n_days = len(self.quantities) // n_skus if n_skus else 0
+            f.writestr('quantities.npy', npy_array(self.quantities, (n_days, n_skus)))
+            f.writestr('skus.npy', npy_strings([str(x) for x in self.skus.values]))
+            f.writestr('medicines.npy', npy_strings([x.id() for x in self.medicines.values]))
+            # in streaming mode only the days still in memory are saved, the rest is in the order log
+            log = dict([(x, array('q')) for x in ('day', 'order', 'medicine', 'quantity', 'kind')])
+            order_keys = []
+            for day, lines in self.log.items():
+                log['day'].extend(array('q', [day]) * len(lines['kind']))
+                log['order'].extend(array('q', [x + len(order_keys) for x in lines['order']]))
+                for name in ('medicine', 'quantity', 'kind'):
+                    log[name].extend(array('q', lines[name]))
+                order_keys.extend(lines['order_keys'].values)
+            f.writestr('order_keys.npy', npy_strings(order_keys))
+            for name, values in log.items():
+                f.writestr(f'log_{name}.npy', npy_array(values))
+            for name, values in self.requests.items():
+                f.writestr(f'requests_{name}.npy', npy_array(values))
+            for name, values in self.routes.items():
+                f.writestr(f'routes_{name}.npy', npy_array(values))
+    
+    def close(self):
+        # a closed store reads its evicted days back from the log files
+        if self.log_writer is not None:
+            self.log_reader = self.get_log_reader()
+            self.log_writer.close()
+            self.log_writer = None
@@ -0,0 +1,186 @@
+import math
+import random
+
+
+class AddressMap:
+    # places 'street, number' addresses on a size x size km plane: every street is a straight segment drawn from a
+    # generator seeded with its name, numbers run along it and odd and even sides lie `side` km apart. Other addresses
+    # get a point drawn from a generator seeded with the address. The depot is in the middle. max_number is the last
+    # house number of the streets, larger numbers are put at the end of their street.
+    def __init__(self, size=10.0, max_number=100, side=0.02):
+        self.size = size
+        self.max_number = max_number
+        self.side = side
+        self.depot = (size / 2, size / 2)
+        self.streets = {}
+        self.points = {}
+    
+    def street(self, name):
+        segment = self.streets.get(name)
+        if segment is None:
+            rng = random.Random(f'street_{name}')
+            segment = self.streets[name] = tuple([rng.uniform(0, self.size) for _ in range(4)])
+        return segment
+    
+    def locate(self, address):
+        point = self.points.get(address)
+        if point is not None:
+            return point
+        street, _, number = address.rpartition(', ')
+        if street and number.isdigit():
+            x0, y0, x1, y1 = self.street(street)
+            t = min(int(number), self.max_number) / self.max_number
+            length = math.hypot(x1 - x0, y1 - y0) or 1.0
+            offset = self.side if int(number) % 2 else -self.side
+            point = (x0 + t * (x1 - x0) - offset * (y1 - y0) / length, y0 + t * (y1 - y0) + offset * (x1 - x0) / length)
+        else:
+            rng = random.Random(f'address_{address}')
+            point = (rng.uniform(0, self.size), rng.uniform(0, self.size))
+        self.points[address] = point
+        return point
+
+
+class GridIndex:
+    # uniform grid over points: cell (i, j) holds the indices of the points in it. Without a cell_size the cells hold
+    # cell_points points on average over the points' bounding box.
+    def __init__(self, points, cell_size=None, cell_points=2):
+        self.points = points
+        if cell_size is None:
+            xs, ys = [x for x, _ in points], [y for _, y in points]
+            area = (max(xs) - min(xs)) * (max(ys) - min(ys)) if points else 0.0
+            cell_size = math.sqrt(cell_points * area / len(points)) if area > 0 else 1.0
+        self.cell_size = cell_size
+        self.cells = {}
+        for idx, (x, y) in enumerate(points):
+            self.cells.setdefault(self.cell(x, y), []).append(idx)
+    
+    def cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+    
+    def near_pairs(self):
+        # (i, j) pairs, i < j, of the points in the same or in adjacent cells, every pair once: a cell is paired with
+        # itself and with its east, north-east, north and north-west neighbours
+        cells = self.cells
+        pairs = []
+        for (ci, cj), members in cells.items():
+            pairs.extend([(a, b) if a < b else (b, a)
+                          for k, a in enumerate(members) for b in members[k + 1:]])
+            for key in ((ci + 1, cj), (ci + 1, cj + 1), (ci, cj + 1), (ci - 1, cj + 1)):
+                others = cells.get(key)
+                if others:
+                    pairs.extend([(a, b) if a < b else (b, a) for a in members for b in others])
+        return pairs
+
+
+class Route:
+    __slots__ = ('stops', 'n_orders', 'length')
+    
+    def __init__(self, stops, n_orders, length):
+        self.stops = stops
+        self.n_orders = n_orders
+        self.length = length
+
+
+class RoutePlanner:
+    # clusters a day's deliveries into courier trips of at most `capacity` orders that start and end at the depot.
+    # Orders to one address form one stop; a stop with more orders than a trip carries gets full trips of its own
+    # first. 'sweep' cuts the stops sorted by their angle around the depot into trips and visits the stops of a trip in
+    # nearest neighbour order, 'savings' merges trips in Clarke-Wright order; only stops in the same or adjacent cells
+    # of a GridIndex with cell_points stops per cell are considered for a merge, which keeps the savings list linear in
+    # the number of stops.
+    methods = ('sweep', 'savings')
+    
+    def __init__(self, address_map=None, capacity=15, method='sweep', cell_points=2):
+        if method not in self.methods:
+            raise ValueError(f'unknown routing method {method}')
+        self.address_map = address_map if address_map is not None else AddressMap()
+        self.capacity = capacity
+        self.method = method
+        self.cell_points = cell_points
+    
+    def distance(self, a, b):
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+    
+    def nearest_neighbour_tour(self, points):
+        # the trip's stops from the depot, always on to the nearest stop not visited yet
+        tour, left = [], list(points)
+        current = self.address_map.depot
+        while left:
+            idx = min(range(len(left)), key=lambda i: self.distance(current, left[i]))
+            current = left.pop(idx)
+            tour.append(current)
+        return tour
+    
+    def route(self, stops, n_orders):
+        stops = self.nearest_neighbour_tour(stops)
+        return Route(stops, n_orders, self.route_length(stops))
+    
+    def route_length(self, points):
+        depot = self.address_map.depot
+        path = [depot] + points + [depot]
+        return sum([self.distance(a, b) for a, b in zip(path, path[1:])])
+    
+    def plan(self, addresses):
+        demand = {}
+        for address in addresses:
+            demand[address] = demand.get(address, 0) + 1
+        routes = []
+        points, stop_demand = [], []
+        for address, n_orders in demand.items():
+            point = self.address_map.locate(address)
+            while n_orders > self.capacity:
+                routes.append(Route([point], self.capacity, self.route_length([point])))
+                n_orders -= self.capacity
+            points.append(point)
+            stop_demand.append(n_orders)
+        if self.method == 'sweep':
+            routes.extend(self.sweep(points, stop_demand))
+        else:
+            routes.extend(self.savings(points, stop_demand))
+        return routes
+    
+    def sweep(self, points, demand):
+        x0, y0 = self.address_map.depot
+        order = sorted(range(len(points)), key=lambda i: math.atan2(points[i][1] - y0, points[i][0] - x0))
+        routes, stops, n_orders = [], [], 0
+        for idx in order:
+            if n_orders + demand[idx] > self.capacity:
+                routes.append(self.route(stops, n_orders))
+                stops, n_orders = [], 0
+            stops.append(points[idx])
+            n_orders += demand[idx]
+        if stops:
+            routes.append(self.route(stops, n_orders))
+        return routes
+    
+    def savings(self, points, demand):
+        depot = self.address_map.depot
+        to_depot = [self.distance(depot, x) for x in points]
+        hypot = math.hypot
+        savings = [(to_depot[i] + to_depot[j] - hypot(points[i][0] - points[j][0], points[i][1] - points[j][1]), i, j)
+                   for i, j in GridIndex(points, cell_points=self.cell_points).near_pairs()]
+        savings.sort(reverse=True)
+        # every stop starts on a trip of its own; a trip is merged only through its end stops
+        trips = dict([(i, [i]) for i in range(len(points))])
+        trip_of = list(range(len(points)))
+        load = list(demand)
+        for saving, i, j in savings:
+            a, b = trip_of[i], trip_of[j]
+            if saving <= 0 or a == b or load[a] + load[b] > self.capacity:
+                continue
+            trip_a, trip_b = trips[a], trips[b]
+            if trip_a[-1] != i:
+                if trip_a[0] != i:
+                    continue
+                trip_a.reverse()
+            if trip_b[0] != j:
+                if trip_b[-1] != j:
+                    continue
+                trip_b.reverse()
+            trip_a.extend(trip_b)
+            load[a] += load[b]
+            for stop in trip_b:
+                trip_of[stop] = a
+            del trips[b]
+        return [Route([points[x] for x in trip], load[a], self.route_length([points[x] for x in trip]))
+                for a, trip in trips.items()]
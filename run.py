@@ -0,0 +1,112 @@
+import argparse
+import json
+
+from instrumentation import Instrumentation, JsonLinesSink, ProfileSink
+from model import Model
+from reorder import POLICIES
+from routing import RoutePlanner
+
+
+def run_model(seed=None, use_numpy=False, **params):
+    if use_numpy:
+        import numpy as np
+        params['np_rng'] = np.random.default_rng(seed)
+        params['numpy_pricing'] = True
+    model = Model(seed=seed, **params)
+    model.init()
+    model.run()
+    return model
+
+
+def to_serializable(value):
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return str(value)
+
+
+def dump_db(db, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(db.to_dict(), f, ensure_ascii=False, default=to_serializable)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the pharmacy simulation without the GUI.')
+    parser.add_argument('--total-days', type=int, default=45)
+    parser.add_argument('--medicines-cnt', type=int, default=10)
+    parser.add_argument('--max-couriers-cnt', type=int, default=10)
+    parser.add_argument('--cap-couriers', action='store_true',
+                        help='hire no more than --max-couriers-cnt couriers, the orders left are not delivered')
+    parser.add_argument('--extra-cost', type=float, default=0.25)
+    parser.add_argument('--discount', type=float, default=0.05)
+    parser.add_argument('--policy', default=None, choices=list(POLICIES),
+                        help='reorder policy, min_instances by default')
+    parser.add_argument('--routing', default=None, choices=RoutePlanner.methods,
+                        help='plan courier trips between the customer addresses, couriers only count orders by default')
+    parser.add_argument('--intraday', action='store_true',
+                        help='run the days as events within the day, e.g. to measure how long orders wait for couriers')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--numpy', action='store_true',
+                        help='generate orders in bulk with a NumPy Generator and price them with NumPy')
+    parser.add_argument('--numpy-pricing', action='store_true', help='price the orders with NumPy only')
+    parser.add_argument('--output', default='results.json', help='file the model db is written to as JSON')
+    parser.add_argument('--npz', default=None, help='also save the results store as binary .npz columns')
+    parser.add_argument('--order-log', default=None,
+                        help='stream order lines to this file and keep only the last days of them in memory')
+    parser.add_argument('--segment-days', type=int, default=None,
+                        help='rotate the --order-log to a new segment file every this many days')
+    parser.add_argument('--snapshot', default=None, help='save a snapshot of the model state after the last day here')
+    parser.add_argument('--resume', default=None,
+                        help='continue from a saved snapshot for --total-days more days, the other model parameters '
+                             'are the snapshot\'s')
+    parser.add_argument('--phase-log', default=None, help='JSON lines file for per-day phase times and counters')
+    parser.add_argument('--profile-phase', default=None, choices=Model.phases + ('run_events',),
+                        help='phase to capture with cProfile, run_events is a whole --intraday day')
+    parser.add_argument('--profile-output', default='phase.prof', help='file the cProfile capture is written to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sinks = []
+    if args.phase_log is not None:
+        sinks.append(JsonLinesSink(args.phase_log))
+    if args.profile_phase is not None:
+        sinks.append(ProfileSink(args.profile_phase, args.profile_output))
+    instrumentation = Instrumentation(sinks) if sinks else None
+    if args.resume is not None:
+        params = dict(order_log=args.order_log) if args.order_log is not None else {}
+        if args.segment_days is not None:
+            params['log_segment_days'] = args.segment_days
+        model = Model.load_snapshot(args.resume, instrumentation=instrumentation, total_days=args.total_days, **params)
+        model.run()
+    else:
+        model = run_model(total_days=args.total_days, medicines_cnt=args.medicines_cnt,
+                          max_couriers_cnt=args.max_couriers_cnt, cap_couriers=args.cap_couriers,
+                          extra_cost=args.extra_cost, discount=args.discount,
+                          seed=args.seed, use_numpy=args.numpy, instrumentation=instrumentation,
+                          order_log=args.order_log, log_segment_days=args.segment_days,
+                          reorder_policy=args.policy, routing=args.routing, intraday=args.intraday,
+                          numpy_pricing=args.numpy_pricing)
+    if instrumentation is not None:
+        instrumentation.close()
+    dump_db(model.db, args.output)
+    if args.npz is not None:
+        model.db.save_npz(args.npz)
+    if args.snapshot is not None:
+        model.save_snapshot(args.snapshot)
+    model.close()
+    print(f'{model.total_days} days simulated, results are written to {args.output}')
+    kpis = model.kpi.period()
+    print(f"revenue {kpis['revenue']:.2f}, cost {kpis['cost']:.2f}, margin {kpis['margin']:.2f}, "
+          f"write-offs {kpis['write_offs']:.2f}, stockout rate {kpis['stockout_rate']:.3f}")
+    if model.routing is not None:
+        lengths = [x for day in sorted(model.db.days) for x in model.db.get_route_lengths(day) if x > 0]
+        print(f'{sum(lengths):.1f} km driven, {sum(lengths) / max(len(lengths), 1):.1f} km per courier and day, '
+              f'longest courier day {max(lengths, default=0.0):.1f} km')
+    if model.events is not None:
+        print(f'{model.events.n_events} events, {model.events.n_dispatched} orders dispatched, mean wait '
+              f'{model.events.mean_wait_hours():.2f} h, max wait {model.events.max_wait_hours:.2f} h')
+
+
+if __name__ == '__main__':
+    main()
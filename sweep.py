@@ -0,0 +1,147 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from statistics import NormalDist
+
+from run import run_model
+
+METRICS = ('income', 'expenses', 'margin', 'write_offs', 'stockout_rate', 'overloading')
+
+
+def grid_points(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[x] for x in names])]
+
+
+def random_points(ranges, n_points, seed=0):
+    rng = random.Random(seed)
+    points = []
+    for _ in range(n_points):
+        point = {}
+        for name, (low, high) in ranges.items():
+            if isinstance(low, int) and isinstance(high, int):
+                point[name] = rng.randint(low, high)
+            else:
+                point[name] = rng.uniform(low, high)
+        points.append(point)
+    return points
+
+
+def run_seed(seed, point_idx, replication):
+    # string seeds are hashed deterministically, so every run gets the same seed in any process and any order
+    return random.Random(f'{seed}_{point_idx}_{replication}').getrandbits(32)
+
+
+def summarize(model):
+    overloading = model.db['couriers_overloading']
+    kpis = model.kpi.period()
+    return {
+        'income': kpis['revenue'],
+        'expenses': kpis['cost'],
+        'margin': kpis['margin'],
+        'write_offs': kpis['write_offs'],
+        'stockout_rate': kpis['stockout_rate'],
+        'overloading': sum(overloading.values()) / len(overloading) if overloading else 0.0,
+    }
+
+
+def run_point(params, seed):
+    # only the summary leaves the worker, the full db is dropped with the model
+    return summarize(run_model(seed=seed, **params))
+
+
+def sweep(points, replications=1, seed=0, max_workers=None):
+    # yields (point idx, replication, metrics) as the runs finish, keeping at most 2 runs per worker in flight
+    max_workers = max_workers or os.cpu_count() or 1
+    runs = ((i, r) for i in range(len(points)) for r in range(replications))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        for point_idx, replication in itertools.islice(runs, 2 * max_workers):
+            future = executor.submit(run_point, points[point_idx], run_seed(seed, point_idx, replication))
+            pending[future] = (point_idx, replication)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                point_idx, replication = pending.pop(future)
+                yield point_idx, replication, future.result()
+            for point_idx, replication in itertools.islice(runs, len(done)):
+                future = executor.submit(run_point, points[point_idx], run_seed(seed, point_idx, replication))
+                pending[future] = (point_idx, replication)
+
+
+class RunningStats:
+    # Welford's online mean and variance
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+    
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+    
+    def std(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+    
+    def confidence_interval(self, confidence=0.95):
+        half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * self.std() / math.sqrt(self.n) if self.n else 0.0
+        return self.mean - half_width, self.mean + half_width
+
+
+def aggregate(results, n_points, confidence=0.95):
+    stats = [dict((x, RunningStats()) for x in METRICS) for _ in range(n_points)]
+    for point_idx, replication, metrics in results:
+        for name, value in metrics.items():
+            stats[point_idx][name].add(value)
+    summary = []
+    for point_stats in stats:
+        point_summary = {}
+        for name, x in point_stats.items():
+            low, high = x.confidence_interval(confidence)
+            point_summary[name] = {'mean': x.mean, 'low': low, 'high': high, 'n': x.n}
+        summary.append(point_summary)
+    return summary
+
+
+def parse_value(value):
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the pharmacy simulation over a grid of parameters.')
+    parser.add_argument('--param', action='append', default=[],
+                        help='model parameter values, e.g. extra_cost=0.1,0.25,0.5 (repeat for a grid)')
+    parser.add_argument('--replications', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='sweep.json')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    grid = {}
+    for param in args.param:
+        name, values = param.split('=')
+        grid[name] = [parse_value(x) for x in values.split(',')]
+    points = grid_points(grid)
+    results = sweep(points, replications=args.replications, seed=args.seed, max_workers=args.workers)
+    summary = aggregate(results, len(points))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump([dict(params=x, **y) for x, y in zip(points, summary)], f, indent=1)
+    print(f'{len(points) * args.replications} runs over {len(points)} points, results are written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import queue
+import threading
+
+from results_store import ResultsStore
+
+
+class SimulationWorker:
+    # runs days of a model in a background thread. Every finished day is reported through self.messages as
+    # ('day', day, metrics) with the day's values of the results store metrics, and the run ends with ('done', day),
+    # ('cancelled', day) or ('error', message). The model is only touched under self.lock, which readers of the model
+    # in other threads take as well.
+    def __init__(self, model, n_days, lock=None):
+        self.model = model
+        self.n_days = n_days
+        self.lock = lock if lock is not None else threading.Lock()
+        self.messages = queue.Queue()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def cancel(self):
+        # the day being simulated is finished first
+        self.cancelled.set()
+    
+    def is_alive(self):
+        return self.thread.is_alive()
+    
+    def run(self):
+        try:
+            for _ in range(self.n_days):
+                if self.cancelled.is_set():
+                    self.messages.put(('cancelled', self.model.curr_day))
+                    return
+                with self.lock:
+                    day = self.model.curr_day
+                    self.model.run_day()
+                    metrics = dict([(x, self.model.db[x].get(day)) for x in ResultsStore.metrics])
+                self.messages.put(('day', day, metrics))
+        except Exception as e:
+            self.messages.put(('error', repr(e)))
+            return
+        self.messages.put(('done', self.model.curr_day))
+    
+    def poll(self):
+        # messages that arrived so far, without blocking
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages